@@ -1,16 +1,10 @@
 """Python unittest Utilities"""
 from __future__ import absolute_import, unicode_literals
 
-import re
+import sys
 
 from collections import namedtuple
 
-from .case import Case
-from .mock import ANY, ContextMock, MagicMock, Mock, call, patch, sentinel
-
-from . import mock
-from . import skip
-
 __version__ = '1.5.3'
 __author__ = 'Ask Solem'
 __contact__ = 'ask@celeryproject.org'
@@ -23,15 +17,6 @@ version_info_t = namedtuple('version_info_t', (
     'major', 'minor', 'micro', 'releaselevel', 'serial'
 ))
 
-# bumpversion can only search for {current_version}
-# so we have to parse the version here.
-_temp = re.match(
-    r'(\d+)\.(\d+).(\d+)(.+)?', __version__).groups()
-VERSION = version_info = version_info_t(
-    int(_temp[0]), int(_temp[1]), int(_temp[2]), _temp[3] or '', '')
-del(_temp)
-del(re)
-
 __all__ = [
     b'Case',
 
@@ -40,3 +25,67 @@ __all__ = [
 
     b'mock', b'skip',
 ]
+
+# Attributes are loaded lazily, so that e.g. ``from case import Mock``
+# does not have to import :mod:`case.case` and :mod:`case.skip`.
+_LAZY_ATTRS = {
+    'Case': 'case.case',
+    'ANY': 'case.mock',
+    'ContextMock': 'case.mock',
+    'MagicMock': 'case.mock',
+    'Mock': 'case.mock',
+    'call': 'case.mock',
+    'patch': 'case.mock',
+    'sentinel': 'case.mock',
+}
+_LAZY_MODULES = set(['case', 'mock', 'skip', 'utils'])
+
+
+def _version_info(version):
+    # bumpversion can only search for {current_version}
+    # so we have to parse the version here.
+    import re
+    major, minor, micro, releaselevel = re.match(
+        r'(\d+)\.(\d+).(\d+)(.+)?', version).groups()
+    return version_info_t(
+        int(major), int(minor), int(micro), releaselevel or '', '')
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        value = getattr(
+            __import__(_LAZY_ATTRS[name], None, None, [name]), name)
+    elif name in _LAZY_MODULES:
+        value = __import__('case.' + name, None, None, [name])
+    elif name in ('VERSION', 'version_info'):
+        value = _version_info(__version__)
+        globals()['VERSION'] = globals()['version_info'] = value
+    else:
+        raise AttributeError(
+            'module {0!r} has no attribute {1!r}'.format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS) | _LAZY_MODULES |
+                  set(['VERSION', 'version_info']))
+
+
+if sys.version_info < (3, 7):  # pragma: no cover
+    # Module level __getattr__ was added in Python 3.7 (PEP 562).
+    from types import ModuleType
+
+    class _LazyModule(ModuleType):
+
+        def __getattr__(self, name):
+            return __getattr__(name)
+
+        def __dir__(self):
+            return __dir__()
+
+    try:
+        sys.modules[__name__].__class__ = _LazyModule
+    except TypeError:  # Python < 3.5: load everything eagerly.
+        for _name in list(_LAZY_ATTRS) + list(_LAZY_MODULES):
+            __getattr__(_name)
@@ -0,0 +1,95 @@
+from __future__ import absolute_import, unicode_literals
+
+import asyncio
+import selectors
+import warnings
+
+from contextlib import contextmanager
+
+from .clock import VirtualClock
+
+__all__ = ['VirtualTimeEventLoop', 'virtual_event_loop']
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+
+    def __init__(self, clock):
+        super(_VirtualSelector, self).__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        # Never block waiting for timers: poll for I/O and if nothing
+        # is ready jump straight to the time of the next timer.
+        if timeout is None:
+            return super(_VirtualSelector, self).select(None)
+        events = super(_VirtualSelector, self).select(0)
+        if not events and timeout > 0:
+            self.clock.advance(timeout)
+        return events
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """Event loop with time provided by a virtual clock.
+
+    When no callbacks are ready the loop advances the clock
+    straight to the next scheduled timer instead of sleeping,
+    so :func:`asyncio.sleep`, :func:`asyncio.wait_for` timeouts and
+    :meth:`~asyncio.AbstractEventLoop.call_later` complete instantly.
+    The loop still blocks when waiting for I/O with no timers pending.
+
+    :keyword clock: :class:`~case.clock.VirtualClock` to use, e.g. the
+        one yielded by :func:`case.mock.virtual_clock`.
+
+    Example::
+
+        loop = VirtualTimeEventLoop()
+        loop.run_until_complete(heartbeat_for(hours=1))  # milliseconds
+        assert loop.time() - start == 3600.0
+
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or VirtualClock()
+        super(VirtualTimeEventLoop, self).__init__(
+            _VirtualSelector(self.clock))
+
+    def time(self):
+        return self.clock.monotonic()
+
+
+def _current_event_loop():
+    # the loop set for this thread, without creating one.
+    policy = asyncio.get_event_loop_policy()
+    local = getattr(policy, '_local', None)
+    if local is not None:
+        return getattr(local, '_loop', None)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        try:
+            return policy.get_event_loop()
+        except RuntimeError:
+            return None
+
+
+@contextmanager
+def virtual_event_loop(clock=None):
+    """Context setting a new :class:`VirtualTimeEventLoop` as the
+    current event loop.
+
+    On exit the previous event loop is set again,
+    and the new loop is closed.
+
+    Example::
+
+        with virtual_event_loop() as loop:
+            loop.run_until_complete(heartbeat_for(hours=1))
+
+    """
+    prev = _current_event_loop()
+    loop = VirtualTimeEventLoop(clock)
+    asyncio.set_event_loop(loop)
+    try:
+        yield loop
+    finally:
+        asyncio.set_event_loop(prev)
+        loop.close()
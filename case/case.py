@@ -4,12 +4,23 @@ import re
 import sys
 import types
 import warnings
+import weakref
 
+from collections import deque
 from contextlib import contextmanager
 from functools import partial
+from itertools import islice
 from six import string_types, itervalues as values, iteritems as items
 
 from . import mock
+from .diff import (
+    MAX_DIFFERENCES, TRUNCATED, brief_repr, first_difference, format_path,
+    iterdiff, itersubset, sequence_diff, take,
+)
+from .fork import HAS_FORK, run_forked_case
+from .leaks import checker
+from .timing import timer
+from .utils import WarningsCapture
 
 try:
     import unittest  # noqa
@@ -21,6 +32,10 @@ except AttributeError:
 
 __all__ = ['Case']
 
+#: Set if unittest runs the phases of tests by calling
+#: _callSetUp, _callTestMethod and _callTearDown (Python 3.8+).
+_HAS_PHASE_METHODS = hasattr(unittest.TestCase, '_callSetUp')
+
 
 # -- adds assertWarns from recent unittest2, not in Python 2.7.
 
@@ -36,6 +51,14 @@ class _AssertRaisesBaseContext(object):
         self.expected_regex = expected_regex
 
 
+#: Cache of :func:`_is_magic_module` results by module type.
+_magic_types = weakref.WeakKeyDictionary()
+
+#: Python 3.4+ invalidates every ``__warningregistry__`` when the
+#: warning filters change, so there is no need to reset them by hand.
+_REGISTRIES_VERSIONED = hasattr(warnings, '_filters_mutated')
+
+
 def _is_magic_module(m):
     # some libraries create custom module types that are lazily
     # lodaded, e.g. Django installs some modules in sys.modules that
@@ -43,42 +66,132 @@ def _is_magic_module(m):
 
     # pyflakes refuses to accept 'noqa' for this isinstance.
     cls, modtype = type(m), types.ModuleType
+    if cls is modtype:
+        return False
+    try:
+        return _magic_types[cls]
+    except (KeyError, TypeError):
+        pass
     try:
         variables = vars(cls)
     except TypeError:
-        return True
+        magic = True
     else:
-        return (cls is not modtype and (
-            '__getattr__' in variables or
-            '__getattribute__' in variables))
+        magic = ('__getattr__' in variables or
+                 '__getattribute__' in variables)
+    try:
+        _magic_types[cls] = magic
+    except TypeError:  # type cannot be weakly referenced
+        pass
+    return magic
+
+
+def _reset_warning_registries():
+    # The __warningregistry__'s need to be in a pristine state for tests
+    # to work properly.
+    if _REGISTRIES_VERSIONED:
+        # resetwarnings() bumps the filters version, which makes
+        # warnings discard stale registries the next time they're used.
+        return
+    for v in list(values(sys.modules)):
+        # do not evaluate Django moved modules and other lazily
+        # initialized modules.
+        if v and not _is_magic_module(v):
+            # use raw __getattribute__ to protect even better from
+            # lazily loaded modules
+            try:
+                object.__getattribute__(v, '__warningregistry__')
+            except AttributeError:
+                pass
+            else:
+                object.__setattr__(v, '__warningregistry__', {})
+
+
+class _Unhashable(Exception):
+    pass
+
+
+_CANONICAL_TAGS = {
+    dict: 'dict', list: 'list', tuple: 'tuple',
+    set: 'set', frozenset: 'set',
+}
+
+
+def _canonical_key(item):
+    # hashable key that is equal for equal dicts, lists, tuples and sets.
+    # Only exact types: subclasses may compare differently (OrderedDict).
+    tag = _CANONICAL_TAGS.get(type(item))
+    if tag is None:
+        try:
+            hash(item)
+        except TypeError:
+            raise _Unhashable(item)
+        return ('', item)
+    elif tag == 'dict':
+        return (tag, frozenset(
+            (_canonical_key(k), _canonical_key(v)) for k, v in items(item)))
+    elif tag == 'set':
+        return (tag, frozenset(_canonical_key(v) for v in item))
+    return (tag, tuple(_canonical_key(v) for v in item))
+
+
+def _item_key(item):
+    try:
+        return _canonical_key(item)
+    except (_Unhashable, RuntimeError):  # RuntimeError: recursion limit
+        pass
+
+
+def _items_difference(expected, actual):
+    """Return ``(missing, unexpected)`` items,
+    like :func:`unittest.util.unorderable_list_difference`.
+
+    Hashable items, and dicts, lists, tuples and sets of hashable
+    items, are matched using a hash table, so only the remaining
+    items are compared one by one.
+
+    """
+    index = {}
+    for i, item in enumerate(actual):
+        key = _item_key(item)
+        if key is not None:
+            index.setdefault(key, deque()).append(i)
+    matched = set()
+    rest_expected = []
+    # like unorderable_list_difference: expected items are matched
+    # last to first, each with the first equal item in actual.
+    for item in reversed(expected):
+        found = index.get(_item_key(item))
+        if found:
+            matched.add(found.popleft())
+        else:
+            rest_expected.append(item)
+    rest_actual = [
+        item for i, item in enumerate(actual) if i not in matched]
+    if rest_expected and rest_actual:
+        rest_expected.reverse()
+        return unorderable_list_difference(rest_expected, rest_actual)
+    return rest_expected, rest_actual
 
 
 class _AssertWarnsContext(_AssertRaisesBaseContext):
-    """A context manager used to implement TestCase.assertWarns* methods."""
+    """A context manager used to implement TestCase.assertWarns* methods.
+
+    Unlike :mod:`unittest`, :attr:`warnings` only lists warnings of the
+    expected category, up to and including the first one matching.
+
+    """
 
     def __enter__(self):
-        # The __warningregistry__'s need to be in a pristine state for tests
-        # to work properly.
         warnings.resetwarnings()
-        for v in list(values(sys.modules)):
-            # do not evaluate Django moved modules and other lazily
-            # initialized modules.
-            if v and not _is_magic_module(v):
-                # use raw __getattribute__ to protect even better from
-                # lazily loaded modules
-                try:
-                    object.__getattribute__(v, '__warningregistry__')
-                except AttributeError:
-                    pass
-                else:
-                    object.__setattr__(v, '__warningregistry__', {})
-        self.warnings_manager = warnings.catch_warnings(record=True)
-        self.warnings = self.warnings_manager.__enter__()
-        warnings.simplefilter('always', self.expected)
+        _reset_warning_registries()
+        self.capture = WarningsCapture(self.expected, self.expected_regex)
+        self.capture.__enter__()
+        self.warnings = self.capture.warnings
         return self
 
     def __exit__(self, exc_type, exc_value, tb):
-        self.warnings_manager.__exit__(exc_type, exc_value, tb)
+        self.capture.__exit__(exc_type, exc_value, tb)
         if exc_type is not None:
             # let unexpected exceptions pass through
             return
@@ -86,21 +199,13 @@ class _AssertWarnsContext(_AssertRaisesBaseContext):
             exc_name = self.expected.__name__
         except AttributeError:
             exc_name = str(self.expected)
-        first_matching = None
-        for m in self.warnings:
-            w = m.message
-            if not isinstance(w, self.expected):
-                continue
-            if first_matching is None:
-                first_matching = w
-            if (self.expected_regex is not None and
-                    not self.expected_regex.search(str(w))):
-                continue
+        if self.capture.satisfied:
             # store warning for later retrieval
-            self.warning = w
-            self.filename = m.filename
-            self.lineno = m.lineno
+            self.warning = self.capture.warning
+            self.filename = self.capture.filename
+            self.lineno = self.capture.lineno
             return
+        first_matching = self.capture.first_expected
         # Now we simply try to choose a helpful failure message
         if first_matching is not None:
             raise self.failureException(
@@ -113,6 +218,12 @@ class _AssertWarnsContext(_AssertRaisesBaseContext):
             raise self.failureException('%s not triggered' % exc_name)
 
 
+def _report_leaks(sample):
+    # not part of the timed cleanup phase.
+    with timer.exclude():
+        checker.report(sample)
+
+
 class CaseMixin(object):
     """Mixin class that adds the utility methods to any unittest TestCase
     class."""
@@ -135,7 +246,7 @@ class CaseMixin(object):
         self.addCleanup(manager.stop)
         return patched
 
-    def mock_modules(self, *mods):
+    def mock_modules(self, *mods, **kwargs):
         """Mock modules for the duration of the test.
 
         See :func:`case.mock.module`
@@ -148,7 +259,7 @@ class CaseMixin(object):
                 '.'.join(mod[:-i] if i else mod) for i in range(len(mod))
             ]))
         modules = sorted(set(modules))
-        return self.wrap_context(mock.module(*modules))
+        return self.wrap_context(mock.module(*modules, **kwargs))
 
     def mask_modules(self, *modules):
         """Make modules for the duration of the test.
@@ -158,6 +269,38 @@ class CaseMixin(object):
         """
         self.wrap_context(mock.mask_modules(*modules))
 
+    def virtual_event_loop(self, clock=None):
+        """Create asyncio event loop using a virtual clock, set as
+        the current event loop until the test completes, when the
+        previous loop is set again and the new loop closed.
+
+        See :func:`case.aio.virtual_event_loop`.
+
+        Example::
+
+            def test_heartbeats(self):
+                loop = self.virtual_event_loop()
+                loop.run_until_complete(heartbeat_for(hours=1))
+
+        """
+        from .aio import virtual_event_loop
+        return self.wrap_context(virtual_event_loop(clock))
+
+    def capture_warnings(self, expected=None, expected_regex=None):
+        """Capture warnings emitted for the rest of the test.
+
+        See :class:`case.utils.WarningsCapture`.
+
+        Example::
+
+            def test_frobulate(self):
+                captured = self.capture_warnings(DeprecationWarning)
+                frobulate()
+                assert captured.find(regex='frobulate is deprecated')
+
+        """
+        return self.wrap_context(WarningsCapture(expected, expected_regex))
+
     def wrap_context(self, context):
         """Wrap context so that the context exits when the test completes."""
         ret = context.__enter__()
@@ -172,6 +315,16 @@ class CaseMixin(object):
         """
         return self.wrap_context(mock.environ(env_name, env_value))
 
+    def mock_environ_overlay(self, values=None, unset=(),
+                             clear=False, isolated=False):
+        """Mock many environment variables for the duration of the test.
+
+        See :func:`case.mock.environ_overlay`.
+
+        """
+        return self.wrap_context(mock.environ_overlay(
+            values, unset=unset, clear=clear, isolated=isolated))
+
 
 class Case(unittest.TestCase, CaseMixin):
     """Test Case
@@ -189,6 +342,23 @@ class Case(unittest.TestCase, CaseMixin):
           methods you must make sure ``super`` is called.
           ``super`` is not necessary for the lowercase versions.
 
+    **Fork isolation**
+
+    Set :attr:`forked` to run every test in a forked child process,
+    so that changes to the process state, like those made by
+    :meth:`mock_modules`, never have to be restored.
+    See :func:`case.fork.run_forked`.
+
+    **Timing**
+
+    How long the setup, call, teardown and cleanup phases of each
+    test take can be recorded, see :class:`case.timing.PhaseTimer`.
+
+    **Memory leaks**
+
+    Tests can be checked for memory retained after they complete,
+    see :class:`case.leaks.LeakChecker`.
+
     **Python 2.6 compatibility**
 
     This class also implements :meth:`assertWarns`, :meth:`assertWarnsRegex`,
@@ -200,6 +370,52 @@ class Case(unittest.TestCase, CaseMixin):
     DeprecationWarning = DeprecationWarning
     PendingDeprecationWarning = PendingDeprecationWarning
 
+    #: Run tests in forked child processes.
+    forked = False
+
+    #: Maximum number of differences reported by
+    #: :meth:`assertDictContainsSubset` and :meth:`assertDictEqual`.
+    maxDifferences = MAX_DIFFERENCES
+
+    #: Maximum number of seconds spent finding and formatting the
+    #: differences reported when an equality assertion fails.
+    #: The size of the diff is limited by :attr:`maxDiff`.
+    diffTimeBudget = 1.0
+
+    def run(self, result=None):
+        if self.forked and HAS_FORK and result is not None:
+            return run_forked_case(self, result, unittest.TestCase.run)
+        if _HAS_PHASE_METHODS:
+            return super(Case, self).run(result)
+        with timer.phase(self.id(), 'call'):
+            return super(Case, self).run(result)
+
+    # -- phases are timed by case.timing.timer, and memory retained
+    # -- checked by case.leaks.checker, if enabled.
+
+    def _callSetUp(self):
+        sample = None if checker.external else checker.start(self.id())
+        if sample is not None:
+            # first cleanup added is the last one called.
+            self.addCleanup(_report_leaks, sample)
+        with timer.phase(self.id(), 'setup'):
+            super(Case, self)._callSetUp()
+
+    def _callTestMethod(self, method):
+        with timer.phase(self.id(), 'call'):
+            with timer.profile(self.id()):
+                super(Case, self)._callTestMethod(method)
+
+    def _callTearDown(self):
+        with timer.phase(self.id(), 'teardown'):
+            super(Case, self)._callTearDown()
+
+    def doCleanups(self):
+        if not _HAS_PHASE_METHODS:  # part of the call phase
+            return super(Case, self).doCleanups()
+        with timer.phase(self.id(), 'cleanup'):
+            return super(Case, self).doCleanups()
+
     def setUp(self):
         self.setup()
 
@@ -231,31 +447,145 @@ class Case(unittest.TestCase, CaseMixin):
                                    r'scheduled for deprecation'):
             yield
 
-    def assertDictContainsSubset(self, expected, actual, msg=None):
-        missing, mismatched = [], []
+    def assertDictContainsSubset(self, expected, actual, msg=None,
+                                 recursive=False):
+        """Assert that the mapping ``actual`` contains all the keys in
+        ``expected``, with equal values.
 
-        for key, value in items(expected):
-            if key not in actual:
-                missing.append(key)
-            elif value != actual[key]:
-                mismatched.append('%s, expected: %s, actual: %s' % (
-                    safe_repr(key), safe_repr(value),
-                    safe_repr(actual[key])))
+        If ``recursive`` is set, nested mappings only need to be subsets
+        too.  At most :attr:`maxDifferences` differences are reported,
+        addressed by path, e.g. ``a.b[3].c``.
+        See :func:`case.diff.itersubset`.
 
-        if not (missing or mismatched):
+        """
+        differences = list(islice(
+            itersubset(expected, actual, recursive=recursive),
+            self.maxDifferences + 1))
+        if not differences:
             return
+        more = len(differences) > self.maxDifferences
+        missing, mismatched, unexpected = [], [], []
+        for d in differences[:self.maxDifferences]:
+            if d.kind == 'missing':
+                missing.append(format_path(d.path))
+            elif d.kind == 'unexpected':
+                unexpected.append('%s: %s' % (
+                    format_path(d.path), brief_repr(d.actual)))
+            else:
+                mismatched.append('%s, expected: %s, actual: %s' % (
+                    format_path(d.path), brief_repr(d.expected),
+                    brief_repr(d.actual)))
 
-        standard_msg = ''
+        errors = []
         if missing:
-            standard_msg = 'Missing: %s' % ','.join(map(safe_repr, missing))
-
+            errors.append('Missing: %s' % ','.join(missing))
         if mismatched:
-            if standard_msg:
-                standard_msg += '; '
-            standard_msg += 'Mismatched values: %s' % (
-                ','.join(mismatched))
+            errors.append('Mismatched values: %s' % ','.join(mismatched))
+        if unexpected:
+            errors.append('Unexpected: %s' % ','.join(unexpected))
+        if more:
+            errors.append('...')
+        self.fail(self._formatMessage(msg, '; '.join(errors)))
+
+    def _diffTruncated(self):
+        if self.maxDiff is not None:
+            return '[... set self.maxDiff to None to see more differences]'
+        return TRUNCATED
+
+    def assertSequenceEqual(self, seq1, seq2, msg=None, seq_type=None):
+        """Like :meth:`unittest.TestCase.assertSequenceEqual`,
+        but only shows the parts of the sequences that differ.
 
-        self.fail(self._formatMessage(msg, standard_msg))
+        The diff is found in linear time, and rendered within the
+        :attr:`diffTimeBudget` and :attr:`maxDiff` limits,
+        see :func:`case.diff.sequence_diff`.
+
+        """
+        if seq_type is not None:
+            seq_type_name = seq_type.__name__
+            if not isinstance(seq1, seq_type):
+                raise self.failureException('First sequence is not a %s: %s'
+                                            % (seq_type_name, safe_repr(seq1)))
+            if not isinstance(seq2, seq_type):
+                raise self.failureException('Second sequence is not a %s: %s'
+                                            % (seq_type_name, safe_repr(seq2)))
+        else:
+            seq_type_name = 'sequence'
+        try:
+            len1, len2 = len(seq1), len(seq2)
+            seq1[:0], seq2[:0]
+        except (TypeError, NotImplementedError):
+            return super(Case, self).assertSequenceEqual(
+                seq1, seq2, msg=msg, seq_type=seq_type)
+        if seq1 == seq2:
+            return
+
+        differing = '%ss differ: %s != %s\n' % (
+            seq_type_name.capitalize(), brief_repr(seq1), brief_repr(seq2))
+        i = first_difference(seq1, seq2)
+        if i < min(len1, len2):
+            differing += '\nFirst differing element %d:\n%s\n%s\n' % (
+                i, brief_repr(seq1[i]), brief_repr(seq2[i]))
+        if len1 > len2:
+            differing += ('\nFirst %s contains %d additional elements.\n'
+                          'First extra element %d:\n%s\n' % (
+                              seq_type_name, len1 - len2,
+                              len2, brief_repr(seq1[len2])))
+        elif len1 < len2:
+            differing += ('\nSecond %s contains %d additional elements.\n'
+                          'First extra element %d:\n%s\n' % (
+                              seq_type_name, len2 - len1,
+                              len1, brief_repr(seq2[len1])))
+        lines = sequence_diff(seq1, seq2, max_size=self.maxDiff,
+                              time_budget=self.diffTimeBudget)
+        if lines and lines[-1] == TRUNCATED:
+            lines[-1] = self._diffTruncated()
+        standardMsg = differing + '\n' + '\n'.join(lines)
+        self.fail(self._formatMessage(msg, standardMsg))
+
+    def assertMultiLineEqual(self, first, second, msg=None):
+        """Like :meth:`unittest.TestCase.assertMultiLineEqual`,
+        but only shows the lines that differ, cut down to show
+        where they differ.
+
+        See :meth:`assertSequenceEqual`.
+
+        """
+        self.assertIsInstance(first, string_types,
+                              'First argument is not a string')
+        self.assertIsInstance(second, string_types,
+                              'Second argument is not a string')
+        if first == second:
+            return
+        lines = sequence_diff(
+            first.splitlines(True), second.splitlines(True), text=True,
+            max_size=self.maxDiff, time_budget=self.diffTimeBudget)
+        if lines and lines[-1] == TRUNCATED:
+            lines[-1] = self._diffTruncated()
+        standardMsg = '%s != %s\n%s' % (
+            brief_repr(first), brief_repr(second), '\n'.join(lines))
+        self.fail(self._formatMessage(msg, standardMsg))
+
+    def assertDictEqual(self, d1, d2, msg=None):
+        """Like :meth:`unittest.TestCase.assertDictEqual`,
+        but reports at most :attr:`maxDifferences` differences
+        found within :attr:`diffTimeBudget`, addressed by path.
+
+        See :func:`case.diff.iterdiff`.
+
+        """
+        self.assertIsInstance(d1, dict, 'First argument is not a dictionary')
+        self.assertIsInstance(d2, dict, 'Second argument is not a dictionary')
+        if d1 == d2:
+            return
+        differences, truncated = take(
+            iterdiff(d1, d2), self.maxDifferences, self.diffTimeBudget)
+        lines = [str(d) for d in differences]
+        if truncated:
+            lines.append(TRUNCATED)
+        standardMsg = '%s != %s\n%s' % (
+            brief_repr(d1), brief_repr(d2), '\n'.join(lines))
+        self.fail(self._formatMessage(msg, standardMsg))
 
     def assertItemsEqual(self, expected_seq, actual_seq, msg=None):
         missing = unexpected = None
@@ -266,8 +596,7 @@ class Case(unittest.TestCase, CaseMixin):
             # Unsortable items (example: set(), complex(), ...)
             expected = list(expected_seq)
             actual = list(actual_seq)
-            missing, unexpected = unorderable_list_difference(
-                expected, actual)
+            missing, unexpected = _items_difference(expected, actual)
         else:
             return self.assertSequenceEqual(expected, actual, msg=msg)
 
@@ -0,0 +1,229 @@
+from __future__ import absolute_import, unicode_literals
+
+import heapq
+import itertools
+import threading
+import time
+
+__all__ = [
+    'VirtualClock', 'TimerHandle',
+    'virtual_condition_wait', 'virtual_select',
+]
+
+_real_time = time.time
+_real_monotonic = getattr(time, 'monotonic', time.time)
+
+#: Class of condition variables
+#: (:func:`threading.Condition` is a factory on Python 2).
+_Condition = getattr(threading, '_Condition', threading.Condition)
+
+
+class TimerHandle(object):
+    """Callback scheduled by :meth:`VirtualClock.call_at`."""
+
+    cancelled = False
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __repr__(self):
+        return '<TimerHandle: {0!r} at {1}{2}>'.format(
+            self.callback, self.when,
+            ' (cancelled)' if self.cancelled else '')
+
+
+class VirtualClock(object):
+    """Simulated clock where time only moves when asked to.
+
+    Every call to :meth:`sleep` advances the clock instantly, running
+    any callbacks scheduled to fire in the meantime.
+
+    :keyword start: Initial wall clock value for :meth:`time`.
+        Defaults to the current time.
+
+    Example::
+
+        clock = VirtualClock()
+        clock.call_later(30.0, on_timeout)
+        clock.sleep(60.0)   # returns instantly, calls on_timeout
+        assert clock.monotonic() - started == 60.0
+
+    """
+
+    #: Names of the :mod:`time` functions the clock provides,
+    #: see :meth:`functions`.
+    names = (
+        'sleep', 'time', 'monotonic', 'perf_counter',
+        'time_ns', 'monotonic_ns', 'perf_counter_ns',
+    )
+
+    def __init__(self, start=None):
+        self._monotonic = _real_monotonic()
+        self._offset = (
+            _real_time() if start is None else start) - self._monotonic
+        self._timers = []
+        self._counter = itertools.count()
+
+    def monotonic(self):
+        return self._monotonic
+    perf_counter = monotonic
+
+    def time(self):
+        return self._monotonic + self._offset
+
+    def monotonic_ns(self):
+        return int(round(self.monotonic() * 1e9))
+    perf_counter_ns = monotonic_ns
+
+    def time_ns(self):
+        return int(round(self.time() * 1e9))
+
+    def sleep(self, seconds):
+        if seconds < 0:
+            raise ValueError('sleep length must be non-negative')
+        self.advance(seconds)
+
+    def call_at(self, when, callback, *args):
+        """Schedule callback to be called at monotonic time ``when``."""
+        handle = TimerHandle(when, callback, args)
+        heapq.heappush(self._timers, (when, next(self._counter), handle))
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        """Schedule callback to be called after ``delay`` seconds."""
+        return self.call_at(self._monotonic + delay, callback, *args)
+
+    def next_deadline(self):
+        """Return monotonic time of the next pending callback,
+        or :const:`None` if there are no callbacks scheduled."""
+        timers = self._timers
+        while timers and timers[0][2].cancelled:
+            heapq.heappop(timers)
+        return timers[0][0] if timers else None
+
+    def advance(self, seconds):
+        """Move the clock ``seconds`` forward, running due callbacks."""
+        self.advance_to(self._monotonic + seconds)
+
+    def advance_to(self, when):
+        """Move the clock forward to monotonic time ``when``.
+
+        Callbacks are called in order, with the clock set to the
+        time they were scheduled for.
+
+        """
+        timers = self._timers
+        while timers and timers[0][0] <= when:
+            due, _, handle = heapq.heappop(timers)
+            if not handle.cancelled:
+                self._monotonic = max(self._monotonic, due)
+                handle.callback(*handle.args)
+        self._monotonic = max(self._monotonic, when)
+
+    def wait_until(self, predicate, timeout):
+        """Advance clock until ``predicate()`` is true or
+        ``timeout`` seconds has passed.
+
+        The clock only jumps between scheduled callbacks, as nothing
+        else can make the predicate true in virtual time.
+
+        """
+        deadline = self._monotonic + timeout
+        while not predicate():
+            when = self.next_deadline()
+            if when is None or when > deadline:
+                self.advance_to(deadline)
+                return predicate()
+            self.advance_to(when)
+        return True
+
+    def functions(self):
+        """Return mapping of :mod:`time` function names to
+        the clock's replacement functions."""
+        return dict((name, getattr(self, name)) for name in self.names)
+
+    def __repr__(self):
+        return '<VirtualClock: monotonic={0} pending={1}>'.format(
+            self._monotonic, len(self._timers))
+
+
+def _waiters(condition):
+    try:
+        return condition._waiters
+    except AttributeError:  # Python 2
+        return condition._Condition__waiters
+
+
+def virtual_condition_wait(clock, wait=None):
+    """Create :meth:`threading.Condition.wait` replacement
+    where timeouts are measured using ``clock``.
+
+    ``wait`` is the method called for waits without a timeout,
+    by default the current :meth:`threading.Condition.wait`.
+
+    While waiting the lock is released and the clock is advanced to
+    the next scheduled callback, until the condition is notified or
+    the timeout expires.  A timeout that no callback can satisfy
+    expires immediately.  Waiting without a timeout still blocks.
+
+    Since :meth:`threading.Event.wait` and :meth:`queue.Queue.get`
+    wait on conditions, this also covers them.
+
+    """
+
+    if wait is None:
+        wait = _Condition.wait
+
+    def wait_virtual(self, timeout=None):
+        if timeout is None:
+            return wait(self, timeout)
+        if not self._is_owned():
+            raise RuntimeError('cannot wait on un-acquired lock')
+        waiter = threading._allocate_lock()
+        waiter.acquire()
+        _waiters(self).append(waiter)
+        saved_state = self._release_save()
+        gotit = False
+        try:
+            gotit = clock.wait_until(
+                lambda: waiter.acquire(False), max(timeout, 0))
+            return gotit
+        finally:
+            self._acquire_restore(saved_state)
+            if not gotit:
+                try:
+                    _waiters(self).remove(waiter)
+                except ValueError:
+                    pass
+    wait_virtual.__doc__ = wait.__doc__
+    return wait_virtual
+
+
+def virtual_select(clock, select):
+    """Create :func:`select.select` replacement where timeouts
+    are measured using ``clock``.
+
+    The file descriptors are polled without blocking every time
+    the clock is advanced to the next scheduled callback, and the
+    timeout expires immediately if no callback is scheduled to run
+    before it.  Selecting without a timeout still blocks.
+
+    """
+
+    def select_virtual(rlist, wlist, xlist, timeout=None):
+        if not timeout:
+            return select(rlist, wlist, xlist, timeout)
+        ready = [([], [], [])]
+
+        def poll():
+            ready[0] = select(rlist, wlist, xlist, 0)
+            return any(ready[0])
+        clock.wait_until(poll, max(timeout, 0))
+        return ready[0]
+    select_virtual.__doc__ = select.__doc__
+    return select_virtual
@@ -0,0 +1,381 @@
+from __future__ import absolute_import, unicode_literals
+
+import re
+import time
+
+from collections import namedtuple
+from difflib import SequenceMatcher
+from itertools import islice
+from six import iteritems as items, string_types
+from six.moves import reprlib, zip
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping  # noqa
+
+__all__ = [
+    'Difference', 'iterdiff', 'diff', 'itersubset', 'subset_diff',
+    'format_path', 'brief_repr',
+    'first_difference', 'mismatch_windows', 'sequence_diff', 'take',
+]
+
+#: Default maximum number of differences to find.
+MAX_DIFFERENCES = 10
+
+#: Default maximum length of the repr of values in messages.
+MAX_REPR = 80
+
+#: Default number of unchanged items shown around differences.
+CONTEXT = 3
+
+#: Default maximum number of items shown from each side of a difference.
+MAX_WINDOW = 50
+
+#: Default maximum length of text lines in diffs.
+MAX_LINE = 100
+
+#: Last line of diffs cut short by the size or time budget.
+TRUNCATED = '[... more differences not shown]'
+
+MISSING = 'missing'
+UNEXPECTED = 'unexpected'
+MISMATCH = 'mismatch'
+
+_IDENTIFIER = re.compile(r'^[^\d\W]\w*$', re.UNICODE)
+
+_monotonic = getattr(time, 'monotonic', time.time)  # before patched
+
+_repr = reprlib.Repr()
+_repr.maxlevel = 3
+_repr.maxdict = _repr.maxlist = _repr.maxtuple = 6
+_repr.maxset = _repr.maxfrozenset = _repr.maxdeque = 6
+_repr.maxstring = _repr.maxother = MAX_REPR
+
+
+def brief_repr(obj, maxsize=MAX_REPR):
+    """Like :func:`repr`, but only looks at as much of the object
+    as needed to return a string of at most ``maxsize`` characters."""
+    try:
+        result = _repr.repr(obj)
+    except Exception:
+        result = object.__repr__(obj)
+    if len(result) > maxsize:
+        return result[:maxsize - 3] + '...'
+    return result
+
+
+def format_path(path):
+    """Format path to nested value, e.g. ``('a', 'b', 3, 'c')``
+    as ``a.b[3].c``."""
+    parts = []
+    for key in path:
+        if isinstance(key, string_types) and _IDENTIFIER.match(key):
+            parts.append('.' + key if parts else key)
+        else:
+            parts.append('[{0}]'.format(brief_repr(key)))
+    return ''.join(parts)
+
+
+class Difference(namedtuple('Difference', (
+        'path', 'kind', 'expected', 'actual'))):
+    """Difference between nested values.
+
+    ``kind`` is one of ``'missing'`` (``expected`` has no counterpart
+    in actual), ``'unexpected'`` (``actual`` has no counterpart in
+    expected), or ``'mismatch'``.
+
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        path = format_path(self.path) or '<value>'
+        if self.kind == MISSING:
+            return '{0}: missing {1}'.format(
+                path, brief_repr(self.expected))
+        elif self.kind == UNEXPECTED:
+            return '{0}: unexpected {1}'.format(
+                path, brief_repr(self.actual))
+        return '{0}: expected {1}, actual {2}'.format(
+            path, brief_repr(self.expected), brief_repr(self.actual))
+
+
+def _equal(expected, actual):
+    try:
+        return bool(expected == actual)
+    except Exception:
+        return False
+
+
+def _walk(expected, actual, subset, path):
+    # yields differences found, or nothing if expected == actual
+    # (or if subset, expected is a subset of actual).
+    if _equal(expected, actual):
+        return
+    found = False
+    if isinstance(expected, Mapping) and isinstance(actual, Mapping):
+        for key, value in items(expected):
+            if key not in actual:
+                found = True
+                yield Difference(path + (key,), MISSING, value, None)
+                continue
+            for d in _walk(value, actual[key], subset, path + (key,)):
+                found = True
+                yield d
+        if not subset:
+            for key in actual:
+                if key not in expected:
+                    found = True
+                    yield Difference(
+                        path + (key,), UNEXPECTED, None, actual[key])
+        if found or subset:
+            return
+    elif (isinstance(expected, (list, tuple)) and
+            type(expected) is type(actual)):
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            for d in _walk(e, a, subset, path + (i,)):
+                found = True
+                yield d
+        for i in range(len(actual), len(expected)):
+            found = True
+            yield Difference(path + (i,), MISSING, expected[i], None)
+        for i in range(len(expected), len(actual)):
+            found = True
+            yield Difference(path + (i,), UNEXPECTED, None, actual[i])
+        if found or subset:
+            return
+    elif (isinstance(expected, (set, frozenset)) and
+            isinstance(actual, (set, frozenset))):
+        for item in expected - actual:
+            yield Difference(path, MISSING, item, None)
+        for item in actual - expected:
+            yield Difference(path, UNEXPECTED, None, item)
+        return
+    # not equal, but nothing to recurse into (or nothing found there).
+    yield Difference(path, MISMATCH, expected, actual)
+
+
+def iterdiff(expected, actual, path=()):
+    """Iterate over :class:`Difference`'s between two values.
+
+    Mappings, lists, tuples and sets are compared recursively, and
+    only values found to be unequal are visited, so stopping early
+    is cheap even for large structures.
+
+    Example::
+
+        >>> [str(d) for d in iterdiff({'a': {'b': [1, 2, {'c': 3}]}},
+        ...                           {'a': {'b': [1, 2, {'c': 4}]}})]
+        ['a.b[2].c: expected 3, actual 4']
+
+    """
+    return _walk(expected, actual, False, tuple(path))
+
+
+def diff(expected, actual, limit=MAX_DIFFERENCES):
+    """Return list of at most ``limit`` differences,
+    see :func:`iterdiff`."""
+    return list(islice(iterdiff(expected, actual), limit))
+
+
+def itersubset(expected, actual, recursive=True, path=()):
+    """Iterate over :class:`Difference`'s preventing mapping
+    ``expected`` from being a subset of mapping ``actual``.
+
+    If ``recursive`` is set, mappings nested in ``expected`` (also
+    inside lists and tuples) only need to be subsets of their
+    counterparts too, otherwise values must be equal and are compared
+    as by :func:`iterdiff`.
+
+    """
+    path = tuple(path)
+    if recursive:
+        return _walk(expected, actual, True, path)
+    return _itersubset_toplevel(expected, actual, path)
+
+
+def _itersubset_toplevel(expected, actual, path):
+    for key, value in items(expected):
+        if key not in actual:
+            yield Difference(path + (key,), MISSING, value, None)
+        else:
+            for d in _walk(value, actual[key], False, path + (key,)):
+                yield d
+
+
+def subset_diff(expected, actual, recursive=True, limit=MAX_DIFFERENCES):
+    """Return list of at most ``limit`` differences,
+    see :func:`itersubset`."""
+    return list(islice(itersubset(expected, actual, recursive), limit))
+
+
+def _equal_run(a, b, i, j, n, chunk=1024):
+    # number of items a[i:i + n] has in common with b[j:j + n] before
+    # the first difference.  Compares chunks first, so it's done in C.
+    k = 0
+    while k < n:
+        c = min(chunk, n - k)
+        if a[i + k:i + k + c] != b[j + k:j + k + c]:
+            break
+        k += c
+    while k < n and a[i + k] == b[j + k]:
+        k += 1
+    return k
+
+
+def _common_suffix(a, b, limit, chunk=1024):
+    la, lb, k = len(a), len(b), 0
+    while k < limit:
+        c = min(chunk, limit - k)
+        if a[la - k - c:la - k] != b[lb - k - c:lb - k]:
+            break
+        k += c
+    while k < limit and a[la - k - 1] == b[lb - k - 1]:
+        k += 1
+    return k
+
+
+def first_difference(a, b):
+    """Return index of the first item (or character) that differs in
+    two sequences, or the length of the shortest if one is a prefix
+    of the other."""
+    return _equal_run(a, b, 0, 0, min(len(a), len(b)))
+
+
+def mismatch_windows(a, b, context=CONTEXT, max_window=MAX_WINDOW):
+    """Iterate over ``(i1, i2, j1, j2)`` tuples where ``a[i1:i2]``
+    differs from ``b[j1:j2]``.
+
+    Only takes linear time: the common prefix and suffix are skipped,
+    and the rest is walked in step, except that when the number
+    of items left differ, the sequences are realigned if the
+    difference is explained by items inserted into (or removed from)
+    one of them.  Differences separated by less than ``2 * context``
+    equal items are joined into the same window, but windows are cut
+    off at ``max_window`` items.
+
+    """
+    n = min(len(a), len(b))
+    start = first_difference(a, b)
+    if start == n and len(a) == len(b):
+        return
+    suffix = _common_suffix(a, b, n - start)
+    end_a, end_b = len(a) - suffix, len(b) - suffix
+    i = j = start
+    window = None
+    while True:
+        same = _equal_run(a, b, i, j, min(end_a - i, end_b - j))
+        i, j = i + same, j + same
+        done = i >= end_a and j >= end_b
+        if window is not None and (same >= 2 * context or done):
+            yield tuple(window)
+            window = None
+        if done:
+            return
+        if window is None:
+            window = [i, i, j, j]
+        left_a, left_b = end_a - i, end_b - j
+        check = min(left_a, left_b, 2 * context + 1)
+        if left_b > left_a and (not left_a or _equal_run(
+                a, b, i, j + left_b - left_a, check) == check):
+            j += left_b - left_a  # items inserted in b
+        elif left_a > left_b and (not left_b or _equal_run(
+                a, b, i + left_a - left_b, j, check) == check):
+            i += left_a - left_b  # items removed from b
+        else:
+            i, j = i + 1, j + 1
+        window[1], window[3] = i, j
+        if max(i - window[0], j - window[2]) >= max_window:
+            yield tuple(window)
+            window = None
+
+
+def _clip(line, focus, width):
+    # text line cut down to width characters around focus.
+    if line.endswith('\n'):
+        line = line[:-1]
+    else:
+        line += ' \\ no newline'
+    if len(line) <= width:
+        return line
+    start = max(0, min(focus - width // 2, len(line) - width))
+    return '{0}{1}{2}'.format(
+        '...' if start else '', line[start:start + width],
+        '...' if start + width < len(line) else '')
+
+
+def _render_window(a, b, window, context, text, max_window):
+    i1, i2, j1, j2 = window
+    if text:
+        focus = 0
+        if i1 < i2 and j1 < j2:
+            focus = first_difference(a[i1], b[j1])
+
+        def render(line):
+            return _clip(line, focus, MAX_LINE)
+    else:
+        render = brief_repr
+    lines = ['@@ [{0}:{1}] != [{2}:{3}] @@'.format(i1, i2, j1, j2)]
+    lines.extend('  ' + render(x) for x in a[max(i1 - context, 0):i1])
+    ra = [render(x) for x in a[i1:min(i2, i1 + max_window)]]
+    rb = [render(x) for x in b[j1:min(j2, j1 + max_window)]]
+    more_a, more_b = i2 - i1 - len(ra), j2 - j1 - len(rb)
+    if i2 - i1 == j2 - j1:
+        for x, y in zip(ra, rb):
+            if x == y:
+                lines.append('  ' + x)
+            else:
+                lines.extend(('- ' + x, '+ ' + y))
+    else:
+        matcher = SequenceMatcher(None, ra, rb, autojunk=False)
+        for tag, x1, x2, y1, y2 in matcher.get_opcodes():
+            if tag == 'equal':
+                lines.extend('  ' + x for x in ra[x1:x2])
+                continue
+            lines.extend('- ' + x for x in ra[x1:x2])
+            lines.extend('+ ' + y for y in rb[y1:y2])
+    if more_a or more_b:
+        lines.append('[... {0} more items in first, {1} in second]'.format(
+            more_a, more_b))
+    else:
+        lines.extend('  ' + render(x) for x in a[i2:i2 + context])
+    return lines
+
+
+def sequence_diff(a, b, context=CONTEXT, max_size=None, time_budget=None,
+                  text=False, max_window=MAX_WINDOW):
+    """Return list of diff lines showing the differences between
+    two sequences, found by :func:`mismatch_windows`.
+
+    Items are formatted using :func:`brief_repr`, or if ``text`` is set
+    the sequences are lines of text, which are cut down to show
+    where they differ.  Windows are rendered until the output is over
+    ``max_size`` characters or ``time_budget`` seconds have passed,
+    so the cost is bounded even for very large inputs.
+
+    """
+    deadline = None if time_budget is None else _monotonic() + time_budget
+    lines, size = [], 0
+    for window in mismatch_windows(a, b, context, max_window):
+        if ((max_size is not None and size > max_size) or
+                (deadline is not None and _monotonic() > deadline)):
+            lines.append(TRUNCATED)
+            break
+        block = _render_window(a, b, window, context, text, max_window)
+        size += sum(len(line) + 1 for line in block)
+        lines.extend(block)
+    return lines
+
+
+def take(iterable, limit=None, time_budget=None):
+    """Return list of at most ``limit`` items from iterable,
+    taken within ``time_budget`` seconds, and a flag set
+    if not all items were taken."""
+    deadline = None if time_budget is None else _monotonic() + time_budget
+    taken = []
+    for item in iterable:
+        if ((limit is not None and len(taken) >= limit) or
+                (deadline is not None and _monotonic() > deadline)):
+            return taken, True
+        taken.append(item)
+    return taken, False
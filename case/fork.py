@@ -0,0 +1,226 @@
+from __future__ import absolute_import, unicode_literals
+
+import importlib
+import os
+import pickle
+import sys
+import traceback
+import unittest
+
+from .utils import WhateverIO, wraps
+
+__all__ = ['ForkedError', 'forked', 'run_forked', 'run_forked_case']
+
+#: Set if the current platform supports :func:`os.fork`.
+HAS_FORK = hasattr(os, 'fork')
+
+
+class ForkedError(Exception):
+    """Error raised by, or for, a forked child process."""
+
+
+class RemoteTraceback(Exception):
+    """Traceback of exception raised in a forked child process."""
+
+    def __init__(self, tb):
+        Exception.__init__(self, tb)
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def _portable_exception(exc, tb):
+    # exceptions are pickled to be sent to the parent, so
+    # if they refuse, substitute with something that doesn't.
+    for candidate in (lambda: exc, lambda: type(exc)(str(exc))):
+        try:
+            candidate = candidate()
+            pickle.loads(pickle.dumps(candidate))
+        except Exception:
+            pass
+        else:
+            return candidate
+    if isinstance(exc, AssertionError):
+        return AssertionError(tb)
+    return ForkedError(tb)
+
+
+def _child(fun, args, kwargs):
+    out, err = WhateverIO(), WhateverIO()
+    sys.stdout, sys.stderr = out, err
+    try:
+        retval = fun(*args, **kwargs)
+    except BaseException as exc:
+        tb = traceback.format_exc()
+        result = ('raise', _portable_exception(exc, tb), tb)
+    else:
+        result = ('return', retval, None)
+    try:
+        return pickle.dumps((result, out.getvalue(), err.getvalue()))
+    except Exception:
+        # unpicklable return value: tests do not return anything useful.
+        return pickle.dumps(
+            (('return', None, None), out.getvalue(), err.getvalue()))
+
+
+def run_forked(fun, *args, **kwargs):
+    """Call ``fun(*args, **kwargs)`` in a forked child process.
+
+    Output written to :data:`sys.stdout` and :data:`sys.stderr` by the
+    child is captured, sent back to the parent over a pipe and written
+    to the parent's streams.  The return value, or exception, is
+    also sent back and returned, or raised, by the parent.
+    The traceback of the exception in the child is set as its cause.
+
+    Any change the child makes to the process state, e.g. to
+    :data:`sys.modules`, is discarded when the child exits.
+
+    On platforms without :func:`os.fork` the function
+    is called in the current process.
+
+    """
+    if not HAS_FORK:
+        return fun(*args, **kwargs)
+    for stream in (sys.stdout, sys.stderr):
+        stream.flush()  # buffered output would be written twice
+    r, w = os.pipe()
+    pid = os.fork()
+    if not pid:  # child
+        status = 1
+        try:
+            os.close(r)
+            payload = _child(fun, args, kwargs)
+            with os.fdopen(w, 'wb') as fh:
+                fh.write(payload)
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(w)
+    with os.fdopen(r, 'rb') as fh:
+        payload = fh.read()
+    _, status = os.waitpid(pid, 0)
+    if not payload:
+        raise ForkedError(
+            'Child process {0} exited with status {1} '
+            'without reporting a result'.format(pid, status))
+    (action, value, tb), out, err = pickle.loads(payload)
+    sys.stdout.write(out)
+    sys.stderr.write(err)
+    if action == 'raise':
+        value.__cause__ = RemoteTraceback(tb)
+        raise value
+    return value
+
+
+def forked(*prewarm):
+    """Decorator running the test in a forked child process.
+
+    See :func:`run_forked`.
+
+    Modules in ``prewarm`` are imported by the parent before
+    forking, so that children start with them already imported.
+
+    Example::
+
+        @forked
+        def test_foo():
+            ...
+
+        @forked('celery.app', 'kombu.transport')
+        @mock.module('celery.app.amqp')
+        def test_bar():
+            ...
+
+    """
+    def _forked(fun):
+
+        @wraps(fun)
+        def _inner(*args, **kwargs):
+            for name in prewarm:
+                importlib.import_module(name)
+            return run_forked(fun, *args, **kwargs)
+        return _inner
+
+    if len(prewarm) == 1 and callable(prewarm[0]):
+        fun, prewarm = prewarm[0], ()
+        return _forked(fun)
+    return _forked
+
+
+class _RecordingResult(unittest.TestResult):
+    # collects outcomes as picklable tuples to be replayed by the parent.
+
+    def __init__(self, *args, **kwargs):
+        super(_RecordingResult, self).__init__(*args, **kwargs)
+        self.events = []
+
+    def _format(self, test, err):
+        return ''.join(traceback.format_exception(*err))
+
+    def addSuccess(self, test):
+        self.events.append(('addSuccess', None))
+
+    def addFailure(self, test, err):
+        self.events.append(('addFailure', self._format(test, err)))
+
+    def addError(self, test, err):
+        self.events.append(('addError', self._format(test, err)))
+
+    def addSkip(self, test, reason):
+        self.events.append(('addSkip', reason))
+
+    def addExpectedFailure(self, test, err):
+        self.events.append(('addExpectedFailure', self._format(test, err)))
+
+    def addUnexpectedSuccess(self, test):
+        self.events.append(('addUnexpectedSuccess', None))
+
+    def addSubTest(self, test, subtest, err):
+        if err is not None:
+            kind = ('addFailure' if issubclass(err[0], test.failureException)
+                    else 'addError')
+            self.events.append((kind, '{0}\n{1}'.format(
+                subtest, self._format(test, err))))
+
+
+def _exc_info(exc):
+    try:
+        raise exc
+    except type(exc):
+        return sys.exc_info()
+
+
+def run_forked_case(test, result, run):
+    """Run :class:`unittest.TestCase` in a forked child process,
+    replaying the outcome on ``result`` in the parent.
+
+    :param run: Function running the test with a result instance,
+        e.g. :meth:`unittest.TestCase.run`.
+
+    """
+    def _run():
+        recorder = _RecordingResult()
+        run(test, recorder)
+        return recorder.events
+    result.startTest(test)
+    try:
+        try:
+            events = run_forked(_run)
+        except Exception as exc:
+            result.addError(test, _exc_info(exc))
+            return result
+        for action, details in events:
+            if action in ('addSuccess', 'addUnexpectedSuccess'):
+                getattr(result, action)(test)
+            elif action == 'addSkip':
+                result.addSkip(test, details)
+            elif action == 'addFailure':
+                result.addFailure(
+                    test, _exc_info(test.failureException(details)))
+            else:
+                getattr(result, action)(
+                    test, _exc_info(ForkedError(details)))
+    finally:
+        result.stopTest(test)
+    return result
@@ -0,0 +1,169 @@
+from __future__ import absolute_import, unicode_literals
+
+import gc
+import os
+import re
+import warnings
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None  # noqa
+
+__all__ = ['LeakChecker', 'LeakWarning', 'MemoryLeak', 'checker']
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+class LeakWarning(UserWarning):
+    """Warning emitted for tests retaining more memory than allowed."""
+
+
+class MemoryLeak(AssertionError):
+    """Error raised for tests retaining more memory than allowed."""
+
+
+def parse_size(size):
+    """Parse size in bytes, with optional unit suffix:
+    ``4096``, ``512K``, ``1M``, ``1.5GB``."""
+    m = re.match(r'^\s*([\d.]+)\s*([KMG]?)(?:i?B)?\s*$', str(size), re.I)
+    if not m:
+        raise ValueError('Invalid size: {0!r}'.format(size))
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2).upper()])
+
+
+def format_size(size):
+    for unit in ('GiB', 'MiB', 'KiB'):
+        scale = _SIZE_UNITS[unit[0]]
+        if abs(size) >= scale:
+            return '{0:.1f} {1}'.format(size / float(scale), unit)
+    return '{0} B'.format(size)
+
+
+class _Sample(object):
+
+    def __init__(self, test, started, snapshot):
+        self.test = test
+        self.started = started
+        self.snapshot = snapshot
+
+
+class LeakChecker(object):
+    """Reports memory retained by tests, using :mod:`tracemalloc`.
+
+    A snapshot of traced memory is taken before the test starts, and
+    compared to one taken after it completes, grouped by source line.
+    If the test retained more than the threshold, a
+    :class:`LeakWarning` is emitted (or :exc:`MemoryLeak` raised,
+    failing the test) listing the lines allocating the most.
+
+    To keep the overhead low enough for the checks to stay enabled,
+    only every Nth test is sampled, and memory is only traced while
+    a sampled test runs.
+
+    Enabled by setting the :envvar:`CASE_LEAKS` environment variable,
+    or the ``--case-leaks`` pytest option, to the threshold
+    (e.g. ``512K``), with :envvar:`CASE_LEAKS_EVERY`
+    (``--case-leaks-every``) setting N, and :envvar:`CASE_LEAKS_FAIL`
+    (``--case-leaks-fail``) failing tests instead of warning.
+
+    Memory still referenced by the test case instance, or by
+    module scoped fixtures created for the test, counts as retained.
+
+    Only available on Python 3.4+ (3.8+ for :class:`case.Case`).
+
+    """
+
+    #: Number of source lines listed for tests over the threshold.
+    top = 5
+
+    #: Set when tests are checked by the pytest plugin,
+    #: so that :class:`case.Case` does not check them again.
+    external = False
+
+    def __init__(self, threshold=None, every=1, fail=False):
+        self.threshold = threshold
+        self.every = every
+        self.fail = fail
+        self._count = 0
+        self._active = None
+
+    def configure(self, threshold=None, every=None, fail=None):
+        if threshold is not None:
+            self.threshold = parse_size(threshold)
+        if every is not None:
+            self.every = max(int(every), 1)
+        if fail is not None:
+            self.fail = fail
+
+    @property
+    def enabled(self):
+        return self.threshold is not None and tracemalloc is not None
+
+    def start(self, test):
+        """Start sampling test, if enabled and it's the test's turn.
+
+        :returns: Sample to pass to :meth:`stop`, or :const:`None`.
+
+        """
+        if not self.enabled or self._active is not None:
+            return
+        self._count += 1
+        if (self._count - 1) % self.every:
+            return
+        gc.collect()
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        self._active = _Sample(test, started, tracemalloc.take_snapshot())
+        return self._active
+
+    def stop(self, sample):
+        """Stop sampling, returning the leak report for the test,
+        or :const:`None` if it stayed under the threshold."""
+        if sample is None or sample is not self._active:
+            return
+        self._active = None
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot()
+        if sample.started:
+            tracemalloc.stop()
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__.replace('.pyc', '.py')),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ]
+        stats = snapshot.filter_traces(filters).compare_to(
+            sample.snapshot.filter_traces(filters), 'lineno')
+        retained = sum(stat.size_diff for stat in stats)
+        if retained <= self.threshold:
+            return
+        lines = ['{0} retained {1} (threshold {2}):'.format(
+            sample.test, format_size(retained),
+            format_size(self.threshold))]
+        grown = [stat for stat in stats if stat.size_diff > 0]
+        for stat in grown[:self.top]:
+            frame = stat.traceback[0]
+            lines.append('  {0}:{1}: {2} in {3} blocks'.format(
+                frame.filename, frame.lineno,
+                format_size(stat.size_diff), stat.count_diff))
+        return '\n'.join(lines)
+
+    def report(self, sample):
+        """Stop sampling, warning or raising :exc:`MemoryLeak`
+        if the test retained more than the threshold."""
+        leak = self.stop(sample)
+        if leak is not None:
+            if self.fail:
+                raise MemoryLeak(leak)
+            warnings.warn(LeakWarning(leak), stacklevel=2)
+
+
+#: Leak checker used by :class:`case.Case` and the pytest plugin.
+checker = LeakChecker(
+    threshold=parse_size(os.environ['CASE_LEAKS'])
+    if os.environ.get('CASE_LEAKS') else None,
+    every=max(int(os.environ.get('CASE_LEAKS_EVERY') or 1), 1),
+    fail=(os.environ.get('CASE_LEAKS_FAIL') or '').lower()
+    not in ('', '0', 'false', 'no'),
+)
@@ -5,16 +5,23 @@ import inspect
 import logging
 import os
 import platform
+import select
 import sys
+import threading
 import time
 import types
 
 from contextlib import contextmanager
 from functools import wraps
-from six import reraise, string_types, iteritems as items
-from six.moves import builtins
+from six import integer_types, reraise, string_types, iteritems as items
+from six.moves import builtins, queue
 
-from .utils import WhateverIO, decorator, get_logger_handlers, noop
+from .clock import (
+    VirtualClock, _Condition, virtual_condition_wait, virtual_select,
+)
+from .utils import (
+    CapturedIO, LogCapture, WhateverIO, decorator, get_logger_handlers, noop,
+)
 
 try:
     from importlib import reload
@@ -41,9 +48,11 @@ __all__ = [
     'ANY', 'ContextMock', 'MagicMock', 'Mock', 'MockCallbacks',
     'call', 'patch', 'sentinel',
 
-    'wrap_logger', 'environ', 'sleepdeprived', 'mask_modules', 'mute',
+    'wrap_logger', 'environ', 'environ_overlay', 'sleepdeprived',
+    'virtual_clock', 'virtual_blocking', 'mask_modules', 'mute',
     'stdouts', 'replace_module_value', 'sys_version', 'pypy_version',
-    'platform_pyimp', 'sys_platform', 'reset_modules', 'module',
+    'platform_pyimp', 'sys_platform', 'reset_modules', 'import_sandbox',
+    'module',
     'open', 'restore_logging', 'module_exists', 'create_patcher',
 ]
 
@@ -268,21 +277,33 @@ class MockCallbacks(object):
 
 
 @decorator
-def wrap_logger(logger, loglevel=logging.ERROR):
+def wrap_logger(logger, loglevel=logging.ERROR, records=False):
     """Wrap :class:`logging.Logger` with a StringIO() handler.
 
-    yields a StringIO handle.
+    yields a :class:`~case.utils.CapturedIO` handle.
+
+    If ``records`` is set the raw log records are kept instead,
+    and a :class:`~case.utils.LogCapture` handler is yielded.
+    Records are then only formatted when asked for.
 
     Example::
 
         with mock.wrap_logger(logger, loglevel=logging.DEBUG) as sio:
             ...
             sio.getvalue()
+            sio.contains('connection lost')
+
+        with mock.wrap_logger(logger, records=True) as logged:
+            ...
+            assert logged.logged(logging.ERROR, contains='lost')
 
     """
     old_handlers = get_logger_handlers(logger)
-    sio = WhateverIO()
-    siohandler = logging.StreamHandler(sio)
+    if records:
+        sio = siohandler = LogCapture()
+    else:
+        sio = CapturedIO()
+        siohandler = logging.StreamHandler(sio)
     logger.handlers = [siohandler]
 
     try:
@@ -314,29 +335,302 @@ def environ(env_name, env_value):
             os.environ[env_name] = prev_val
 
 
+class _EnvironOverlay(object):
+    # Records the previous value of every environment variable touched,
+    # so that restoring only needs to visit the changed keys.
+    _missing = object()
+
+    def __init__(self, environ):
+        self.environ = environ
+        self.saved = {}
+
+    def _touch(self, key):
+        if key not in self.saved:
+            self.saved[key] = self.environ.get(key, self._missing)
+
+    def __getitem__(self, key):
+        return self.environ[key]
+
+    def __contains__(self, key):
+        return key in self.environ
+
+    def __setitem__(self, key, value):
+        self._touch(key)
+        self.environ[key] = value
+
+    def __delitem__(self, key):
+        self._touch(key)
+        self.environ.pop(key, None)
+
+    def update(self, values=(), **kwargs):
+        for key, value in items(dict(values, **kwargs)):
+            self[key] = value
+
+    def unset(self, *keys):
+        for key in keys:
+            del self[key]
+
+    def clear(self):
+        self.unset(*list(self.environ))
+
+    def restore(self):
+        for key, value in items(self.saved):
+            if value is self._missing:
+                self.environ.pop(key, None)
+            else:
+                self.environ[key] = value
+        self.saved.clear()
+
+
 @decorator
-def sleepdeprived(module=time):
+def environ_overlay(values=None, unset=(), clear=False, isolated=False):
+    """Mock many environment variables at once.
+
+    Only the variables touched are recorded, and only these
+    are restored when the context exits.
+
+    :keyword values: Mapping of environment variables to set.
+    :keyword unset: Names of environment variables to remove.
+    :keyword clear: Remove all environment variables first.
+    :keyword isolated: Replace :data:`os.environ` with a private copy
+        for the duration of the context.  Note that the copy is a
+        plain :class:`dict`, so changes are not seen by subprocesses.
+
+    Yields the overlay, which can be used to set and remove more
+    variables inside the context.
+
+    Decorator example::
+
+        @mock.environ_overlay({'DJANGO_SETTINGS_MODULE': 'proj.settings',
+                               'CELERY_BROKER_URL': 'memory://'},
+                              unset=['CELERY_RESULT_BACKEND'])
+        def test_other_settings(self, environ):
+            ...
+
+    Context example::
+
+        with mock.environ_overlay(clear=True) as environ:
+            environ['HOME'] = '/tmp'
+
+    """
+    prev_environ = os.environ
+    if isolated:
+        os.environ = dict(prev_environ)
+    overlay = _EnvironOverlay(os.environ)
+    try:
+        if clear:
+            overlay.clear()
+        overlay.unset(*unset)
+        overlay.update(values or {})
+        yield overlay
+    finally:
+        if isolated:
+            os.environ = prev_environ
+        else:
+            overlay.restore()
+
+
+_time_functions = dict(
+    (name, getattr(time, name, None)) for name in VirtualClock.names)
+
+
+def _is_time_function(name, fun):
+    return (fun is _time_functions[name] or
+            isinstance(getattr(fun, '__self__', None), VirtualClock))
+
+
+def _patch_clock(clock, modules):
+    # Patch the time functions of modules with the clock's functions.
+    # sleep is always replaced if present (like sleepdeprived does),
+    # other functions only if they are the real time functions
+    # (or those of another virtual clock), as a module may use the
+    # same names for something else.
+    patched = []
+    for module in modules:
+        for name, fun in items(clock.functions()):
+            try:
+                prev = getattr(module, name)
+            except AttributeError:
+                continue
+            if name == 'sleep' or _is_time_function(name, prev):
+                setattr(module, name, fun)
+                patched.append((module, name, prev))
+    return patched
+
+
+def _unpatch_clock(patched):
+    for module, name, prev in reversed(patched):
+        setattr(module, name, prev)
+
+
+@decorator
+def sleepdeprived(module=time, clock=None):
     """Mock time.sleep to do nothing.
 
+    If ``clock`` is set, sleep will instead advance a
+    :class:`~case.clock.VirtualClock`, and the other :mod:`time`
+    functions in ``module`` will read from the same clock.
+    Pass :const:`True` to create a new clock.  The clock is yielded.
+
     Example::
 
         @mock.sleepdeprived()  # < patches time.sleep
         @mock.sleepdeprived(celery.result)  # < patches celery.result.sleep
 
+        with mock.sleepdeprived(clock=True) as clock:
+            retry_with_backoff(fun)  # sleeps instantly
+            assert clock.monotonic() - start == 30.0
+
+    """
+    if clock is None:
+        old_sleep, module.sleep = module.sleep, noop
+        try:
+            yield
+        finally:
+            module.sleep = old_sleep
+    else:
+        if clock is True:
+            clock = VirtualClock()
+        patched = _patch_clock(clock, [module])
+        try:
+            yield clock
+        finally:
+            _unpatch_clock(patched)
+
+
+@decorator
+def virtual_clock(*modules, **kwargs):
+    """Patch :mod:`time` functions to use a simulated clock.
+
+    ``sleep``, ``time``, ``monotonic`` and ``perf_counter`` (and the
+    ``_ns`` variants returning integer nanoseconds) are replaced in
+    every module given (defaults to the :mod:`time` module itself),
+    so they all agree with each other.  Sleeping
+    advances the clock instantly, running any callbacks scheduled
+    on the clock in the meantime.
+
+    :keyword clock: Existing :class:`~case.clock.VirtualClock` to use.
+    :keyword start: Initial wall clock time for new clock.
+
+    Yields the :class:`~case.clock.VirtualClock`.
+
+    Example::
+
+        @mock.virtual_clock(time, celery.backends.base)
+        def test_retry(self, clock):
+            clock.call_later(10.0, server.start)
+            result = connect_with_retry()
+            assert clock.monotonic() - start == 10.0
+
     """
-    old_sleep, module.sleep = module.sleep, noop
+    clock = kwargs.get('clock') or VirtualClock(start=kwargs.get('start'))
+    patched = _patch_clock(clock, modules or [time])
     try:
-        yield
+        yield clock
+    finally:
+        _unpatch_clock(patched)
+
+
+@decorator
+def virtual_blocking(clock=None):
+    """Make blocking timeouts expire in virtual time.
+
+    Timeouts passed to :meth:`threading.Condition.wait`,
+    :meth:`threading.Event.wait`, :meth:`queue.Queue.get`/``put``
+    and :func:`select.select` are measured using a
+    :class:`~case.clock.VirtualClock`, and expire immediately unless
+    a callback scheduled on the clock satisfies them first.
+    Waits without a timeout still block for real.
+
+    The patches are process wide, so they affect all threads.
+    :class:`queue.SimpleQueue` and selectors other than
+    :class:`selectors.SelectSelector` are implemented in C
+    and are not affected.
+
+    :keyword clock: Existing clock to use, e.g. the one yielded
+        by :func:`virtual_clock`.
+
+    Yields the clock.
+
+    Example::
+
+        with mock.virtual_clock() as clock:
+            with mock.virtual_blocking(clock):
+                clock.call_later(30.0, ready.set)
+                assert ready.wait(timeout=60.0)
+                with pytest.raises(queue.Empty):
+                    q.get(timeout=10.0)
+
+    """
+    clock = clock or VirtualClock()
+    patched = [
+        (_Condition, 'wait', virtual_condition_wait(clock, _Condition.wait)),
+        (select, 'select', virtual_select(clock, select.select)),
+    ]
+    # wait_for/get/put measure remaining time with these
+    # module level aliases of time.monotonic.
+    for module, name in ((threading, '_time'), (queue, 'time')):
+        if hasattr(module, name):
+            patched.append((module, name, clock.monotonic))
+    prev = [(obj, name, getattr(obj, name)) for obj, name, _ in patched]
+    for obj, name, value in patched:
+        setattr(obj, name, value)
+    try:
+        yield clock
     finally:
-        module.sleep = old_sleep
+        for obj, name, value in prev:
+            setattr(obj, name, value)
+
+
+_ModuleNotFoundError = getattr(builtins, 'ModuleNotFoundError', ImportError)
+
+
+class _MaskedModuleFinder(object):
+    # Meta path finder refusing to import masked modules and
+    # their submodules.  Names are stored in a trie of name parts,
+    # so most unmasked imports are rejected after one dict lookup.
+
+    def __init__(self, modnames):
+        self.names = frozenset(module_name(name) for name in modnames)
+        self.trie = {}
+        for name in self.names:
+            node = self.trie
+            for part in name.split('.'):
+                node = node.setdefault(part, {})
+            node[None] = True
+
+    def masks(self, fullname):
+        if fullname in self.names:
+            return True
+        node = self.trie
+        for part in fullname.split('.'):
+            node = node.get(part)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+    def find_spec(self, fullname, path=None, target=None):
+        if self.masks(fullname):
+            raise _ModuleNotFoundError('No module named %s' % fullname)
+
+    def find_module(self, fullname, path=None):  # Python 2
+        if self.masks(fullname):
+            return self
+
+    def load_module(self, fullname):  # Python 2
+        raise _ModuleNotFoundError('No module named %s' % fullname)
 
 
-# Taken from
-# http://bitbucket.org/runeh/snippets/src/tip/missing_modules.py
 @decorator
 def mask_modules(*modnames):
     """Ban some modules from being importable inside the context
 
+    Submodules of masked modules are also masked, and masked modules
+    that are already imported are hidden from :data:`sys.modules`
+    until the context exits.
+
     For example::
 
         >>> with mask_modules('sys'):
@@ -357,19 +651,31 @@ def mask_modules(*modnames):
             ...
 
     """
-    realimport = builtins.__import__
-
-    def myimp(name, *args, **kwargs):
-        if name in modnames:
-            raise ImportError('No module named %s' % name)
-        else:
-            return realimport(name, *args, **kwargs)
-
-    builtins.__import__ = myimp
+    finder = _MaskedModuleFinder(modnames)
+    hidden = dict(
+        (name, sys.modules.pop(name))
+        for name in list(sys.modules) if finder.masks(name)
+    )
+    # also hide them as attributes of their parent package,
+    # or ``from parent import masked`` would still work.
+    hidden_attrs = []
+    for name, mod in items(hidden):
+        parent, _, attr = name.rpartition('.')
+        parent = sys.modules.get(parent) if parent else None
+        if parent is not None and getattr(parent, attr, None) is mod:
+            delattr(parent, attr)
+            hidden_attrs.append((parent, attr, mod))
+    sys.meta_path.insert(0, finder)
     try:
         yield
     finally:
-        builtins.__import__ = realimport
+        try:
+            sys.meta_path.remove(finder)
+        except ValueError:
+            pass
+        sys.modules.update(hidden)
+        for parent, attr, mod in hidden_attrs:
+            setattr(parent, attr, mod)
 
 
 @decorator
@@ -377,6 +683,10 @@ def stdouts():
     """Override `sys.stdout` and `sys.stderr` with `StringIO`
     instances.
 
+    The instances are :class:`~case.utils.CapturedIO` objects,
+    so they can also be searched incrementally using
+    ``contains``, ``count``, ``finditer`` and ``wait_for``.
+
     Decorator example::
 
         @mock.stdouts
@@ -393,7 +703,7 @@ def stdouts():
     """
     prev_out, prev_err = sys.stdout, sys.stderr
     prev_rout, prev_rerr = sys.__stdout__, sys.__stderr__
-    mystdout, mystderr = WhateverIO(), WhateverIO()
+    mystdout, mystderr = CapturedIO(), CapturedIO()
     sys.stdout = sys.__stdout__ = mystdout
     sys.stderr = sys.__stderr__ = mystderr
 
@@ -564,6 +874,9 @@ def reset_modules(*modules):
         with mock.reset_modules('celery.result', 'celery.app.base'):
             pass
 
+    See also :func:`import_sandbox`, which only executes
+    the modules once.
+
     """
     prev = dict((k, sys.modules.pop(k))
                 for k in modules if k in sys.modules)
@@ -575,10 +888,201 @@ def reset_modules(*modules):
         sys.modules.update(prev)
 
 
+#: Modules imported fresh by :func:`import_sandbox` with ``cache``,
+#: mapping module name to ``(module, pristine_namespace, dependencies)``.
+_pristine_modules = {}
+
+_IMMUTABLE_TYPES = (
+    type(None), bool, float, complex, bytes, types.ModuleType,
+    types.BuiltinFunctionType,
+) + integer_types + string_types
+
+
+def _is_immutable(value, module):
+    # value that a module namespace may share between imports:
+    # anything that is not changed in place, or that another module
+    # owns (a fresh import would get the same object anyway).
+    if isinstance(value, _IMMUTABLE_TYPES):
+        return True
+    if isinstance(value, (tuple, frozenset)):
+        return all(_is_immutable(v, module) for v in value)
+    if isinstance(value, type):
+        return value.__module__ != module
+    if isinstance(value, types.FunctionType):
+        if value.__module__ != module:
+            return True
+        defaults = (value.__defaults__ or ()) + tuple(
+            (getattr(value, '__kwdefaults__', None) or {}).values())
+        return not value.__dict__ and _is_immutable(defaults, module)
+    return False
+
+
+def _is_cacheable(mod):
+    # module namespace can be safely restored from a copy only if it's
+    # a regular Python module (not a package or extension module),
+    # without mutable module level state: a copy is shallow.
+    filename = getattr(mod, '__file__', None) or ''
+    if hasattr(mod, '__path__') or not filename.endswith(('.py', '.pyc')):
+        return False
+    return all(
+        _is_immutable(value, mod.__name__)
+        for key, value in items(mod.__dict__)
+        if not (key.startswith('__') and key.endswith('__'))
+    )
+
+
+def _set_parent_attr(name, mod):
+    parent, _, attr = name.rpartition('.')
+    parent = sys.modules.get(parent) if parent else None
+    if parent is not None:
+        setattr(parent, attr, mod)
+
+
+def _restore_pristine(name, entry):
+    mod, pristine, dependencies = entry
+    modules = sys.modules
+    for dep_name, dep in items(dependencies):
+        if modules.get(dep_name, dep) is not dep:
+            return None  # imported again since: namespace is stale.
+    for dep_name in sorted(dependencies):
+        modules[dep_name] = dependencies[dep_name]
+        _set_parent_attr(dep_name, dependencies[dep_name])
+    mod.__dict__.clear()
+    mod.__dict__.update(pristine)
+    modules[name] = mod
+    _set_parent_attr(name, mod)
+    return mod
+
+
+def _fresh_import(name, cache=False):
+    entry = _pristine_modules.pop(name, None) if cache else None
+    if entry is not None:
+        mod = _restore_pristine(name, entry)
+        if mod is not None:
+            _pristine_modules[name] = entry
+            return mod
+    sys.modules.pop(name, None)
+    before = set(sys.modules)
+    mod = importlib.import_module(name)
+    if cache and _is_cacheable(mod):
+        dependencies = dict(
+            (k, v) for k, v in items(sys.modules)
+            if k not in before and k != name and v is not None)
+        _pristine_modules[name] = (mod, dict(mod.__dict__), dependencies)
+    return mod
+
+
+class _ImportSandbox(object):
+
+    #: Sets of module names frozen when the sandbox is restored.
+    _imported = _replaced = None
+
+    def __init__(self):
+        self.snapshot = dict(sys.modules)
+
+    @property
+    def imported(self):
+        """Names of modules imported inside the sandbox."""
+        if self._imported is not None:
+            return self._imported
+        return set(sys.modules).difference(self.snapshot)
+
+    @property
+    def replaced(self):
+        """Names of modules replaced or removed inside the sandbox."""
+        if self._replaced is not None:
+            return self._replaced
+        modules = sys.modules
+        return set(
+            name for name, mod in items(self.snapshot)
+            if modules.get(name) is not mod
+        )
+
+    def restore(self):
+        modules, snapshot = sys.modules, self.snapshot
+        imported, replaced = self.imported, self.replaced
+        self._imported, self._replaced = imported, replaced
+        for name in imported:
+            mod = modules.pop(name)
+            parent, _, attr = name.rpartition('.')
+            parent = snapshot.get(parent)
+            if parent is not None and getattr(parent, attr, None) is mod:
+                delattr(parent, attr)
+        for name in replaced:
+            modules[name] = snapshot[name]
+            parent, _, attr = name.rpartition('.')
+            parent = snapshot.get(parent)
+            if parent is not None and hasattr(parent, attr):
+                setattr(parent, attr, snapshot[name])
+
+
 @decorator
-def module(*names):
-    """Mock one or modules such that every attribute is a :class:`Mock`."""
+def import_sandbox(*fresh, **kwargs):
+    """Restore :data:`sys.modules` to its previous state
+    when the test/context returns.
+
+    Every module imported or replaced inside the sandbox is
+    recorded, and on exit only those entries are restored.
+
+    Modules named in ``fresh`` are imported anew inside the
+    sandbox.  With ``cache=True``, plain Python modules (not packages
+    or extensions) without mutable module level state (like dicts,
+    lists, or classes defined in the module) are only executed the
+    first time: later sandboxes reuse the same module with its
+    namespace reset to a copy taken right after it was first
+    imported, and put back the modules that import added to
+    :data:`sys.modules`.
+
+    Yields the sandbox, with ``imported`` and ``replaced``
+    sets of module names (still available after the sandbox
+    is restored).
+
+    Decorator example::
+
+        @mock.import_sandbox('celery.result')
+        def test_foo(self, sandbox):
+            pass
+
+    Context example::
+
+        with mock.import_sandbox('celery.result') as sandbox:
+            import celery.contrib.testing
+        assert 'celery.contrib.testing' in sandbox.imported
+
+    """
+    cache = kwargs.get('cache', False)
+    sandbox = _ImportSandbox()
+    try:
+        for name in fresh:
+            _fresh_import(module_name(name), cache=cache)
+        yield sandbox
+    finally:
+        sandbox.restore()
+
+
+@decorator
+def module(*names, **kwargs):
+    """Mock one or modules such that every attribute is a :class:`Mock`.
+
+    If ``autospec`` is set, the source of the real modules is parsed
+    (but not executed) to find the names they define, and the mock
+    modules only allow access to those names, with functions and classes
+    autospecced from their signatures.  This requires the modules to
+    have Python source (a ``.py`` file): :exc:`ImportError` is raised
+    for extension modules and modules that cannot be found.
+    See :class:`case.spec.StaticSpecModule`.
+
+    Yields the list of mock modules.
+
+    Example::
+
+        with mock.module('kombu.connection', autospec=True) as (conn,):
+            conn.Connection(hostname='localhost')
+            conn.Conection  # AttributeError
+
+    """
     prev = {}
+    autospec = kwargs.get('autospec', False)
 
     class MockModule(types.ModuleType):
 
@@ -586,6 +1090,15 @@ def module(*names):
             setattr(self, attr, Mock())
             return types.ModuleType.__getattribute__(self, attr)
 
+    if autospec:
+        # find all specs before any of the mock modules
+        # are installed, as they shadow the real packages.
+        from .spec import StaticSpecModule, static_module_spec
+        specs = dict((name, static_module_spec(name)) for name in names)
+
+        def MockModule(name):  # noqa
+            return StaticSpecModule(name, specs[name])
+
     mods = []
     for name in names:
         try:
@@ -658,9 +1171,73 @@ def open(typ=WhateverIO, side_effect=None):
             yield val
 
 
+def _logger_state(logger):
+    return (logger.level, list(logger.handlers), list(logger.filters),
+            logger.propagate, logger.disabled)
+
+
+def _snapshot_logging():
+    manager = logging.Logger.manager
+    loggers = dict(
+        (name, (logger, _logger_state(logger)))
+        for name, logger in items(dict(manager.loggerDict))
+        if isinstance(logger, logging.Logger)
+    )
+    root = logging.getLogger()
+    return manager.disable, root, _logger_state(root), loggers
+
+
+def _restore_logger(logger, state):
+    level, handlers, filters, propagate, disabled = state
+    changed_level = logger.level != level
+    if changed_level:
+        logger.level = level
+    if logger.handlers != handlers:
+        logger.handlers[:] = handlers
+    if logger.filters != filters:
+        logger.filters[:] = filters
+    logger.propagate = propagate
+    logger.disabled = disabled
+    return changed_level
+
+
+_pristine_logger_state = (logging.NOTSET, [], [], True, False)
+
+
+def _restore_logging(snapshot):
+    manager = logging.Logger.manager
+    disable, root, root_state, loggers = snapshot
+    changed_level = manager.disable != disable
+    manager.disable = disable
+    changed_level |= _restore_logger(root, root_state)
+    for name, logger in items(dict(manager.loggerDict)):
+        if not isinstance(logger, logging.Logger):
+            continue
+        try:
+            prev, state = loggers[name]
+        except KeyError:
+            # logger created inside the context: code may still
+            # keep a reference to it, so reset it rather than removing it.
+            state = _pristine_logger_state
+        else:
+            if prev is not logger:
+                manager.loggerDict[name] = logger = prev
+        changed_level |= _restore_logger(logger, state)
+    if changed_level:
+        # Python 3.7+ caches isEnabledFor() results,
+        # clear the cache once instead of for every logger.
+        clear_cache = getattr(manager, '_clear_cache', None)
+        if clear_cache is not None:
+            clear_cache()
+
+
 @decorator
 def restore_logging():
-    """Restore root logger handlers after test returns.
+    """Restore logging configuration after test returns.
+
+    Saves the level, handlers, filters and propagate flag of every
+    logger in the logging tree, and only restores what changed.
+    Loggers created inside the context are reset to the defaults.
 
     Decorator example::
 
@@ -675,16 +1252,13 @@ def restore_logging():
 
     """
     outs = sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__
-    root = logging.getLogger()
-    level = root.level
-    handlers = root.handlers
+    snapshot = _snapshot_logging()
 
     try:
         yield
     finally:
         sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__ = outs
-        root.level = level
-        root.handlers[:] = handlers
+        _restore_logging(snapshot)
 
 
 @decorator
@@ -1,5 +1,6 @@
 from __future__ import absolute_import, unicode_literals
 
+import inspect
 import pytest
 import sys
 
@@ -8,15 +9,137 @@ from six import iteritems as items
 
 from . import patch
 from . import mock
+from . import skip
+from .leaks import LeakWarning, MemoryLeak, checker
+from .timing import timer
+from .utils import WarningsCapture
 
 sentinel = object()
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup('case')
+    group.addoption(
+        '--case-slow-budget', type=float, default=None, metavar='SECONDS',
+        help='Skip tests decorated with skip.if_slow when their '
+             'historical p95 duration is over budget.')
+    group.addoption(
+        '--case-run-profile', default=None, metavar='NAME',
+        help='Name of run profile used to record test durations '
+             'for skip.if_slow.')
+    group.addoption(
+        '--case-timings', default=None, metavar='PATH',
+        help='Time the setup, call and teardown phases of tests, '
+             'writing a JSON report to PATH.')
+    group.addoption(
+        '--case-timings-top', type=int, default=None, metavar='N',
+        help='Number of slowest tests and contexts to list '
+             'with --case-timings.')
+    group.addoption(
+        '--case-cprofile', default=None, metavar='DIR',
+        help='Profile the call phase of every test with cProfile, '
+             'saving the stats in DIR.')
+    group.addoption(
+        '--case-leaks', default=None, metavar='SIZE',
+        help='Warn about tests retaining more than SIZE (e.g. 512K) '
+             'of memory, measured using tracemalloc.')
+    group.addoption(
+        '--case-leaks-every', type=int, default=None, metavar='N',
+        help='Only check every Nth test with --case-leaks.')
+    group.addoption(
+        '--case-leaks-fail', action='store_true', default=None,
+        help='Fail tests going over the --case-leaks threshold.')
+
+
+def pytest_configure(config):
+    skip.timings.configure(
+        budget=config.getoption('case_slow_budget'),
+        profile=config.getoption('case_run_profile'),
+        root=str(config.rootdir),
+    )
+    timer.configure(
+        report=config.getoption('case_timings'),
+        top=config.getoption('case_timings_top'),
+        cprofile=config.getoption('case_cprofile'),
+    )
+    checker.configure(
+        threshold=config.getoption('case_leaks'),
+        every=config.getoption('case_leaks_every'),
+        fail=config.getoption('case_leaks_fail'),
+    )
+    if checker.enabled:
+        checker.external = True
+        config.pluginmanager.register(_LeakChecks(), 'case-leaks')
+
+
+class _LeakChecks(object):
+    # registered only if enabled, so there's no overhead otherwise.
+
+    sample = None
+
+    # the checks are not part of the timed phases.
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_setup(self, item):
+        with timer.exclude():
+            checker.stop(self.sample)  # in case teardown failed
+            self.sample = checker.start(item.nodeid)
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_runtest_teardown(self, item):
+        sample, self.sample = self.sample, None
+        with timer.exclude():
+            leak = checker.stop(sample)
+        if leak is not None:
+            if checker.fail:
+                raise MemoryLeak(leak)
+            item.warn(LeakWarning(leak))
+
+
+def pytest_sessionfinish(session):
+    skip.timings.save()
+
+
+def pytest_terminal_summary(terminalreporter):
+    lines = timer.finish()
+    if lines:
+        terminalreporter.write_sep('=', 'case timings')
+        for line in lines:
+            terminalreporter.write_line(line)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_setup(item):
+    with timer.phase(item.nodeid, 'setup'):
+        yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    with timer.phase(item.nodeid, 'call'):
+        with timer.profile(item.nodeid):
+            yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_teardown(item):
+    with timer.phase(item.nodeid, 'teardown'):
+        yield
+
+
 class fixture_with_options(object):
     """Pytest fixture with options specified in separate decrorator.
 
     The decorated fixture MUST take the request fixture as first argument,
-    but is free to use other fixtures.
+    but is free to use other fixtures.  It may also be a generator,
+    in which case the code after ``yield`` is run at finalization.
+
+    With a ``scope`` other than ``'function'`` (``'class'``,
+    ``'module'``, ``'package'`` or ``'session'``), the value is reused
+    by all tests in that scope using the same options, so expensive
+    fixtures are only created once for every distinct set of options,
+    and finalized at the end of the scope.  Such fixtures can only
+    use other fixtures with the same or a broader scope.
 
     Example:
         @fixture_with_options()
@@ -29,20 +152,46 @@ class fixture_with_options(object):
         def test_foo(sftp):
             assert sftp['username'] == 'foo'
             assert sftp['password'] == 'bar'
+
+        @fixture_with_options(scope='module')
+        def broker(request, port=5672):
+            server = start_broker(port)
+            yield server
+            server.stop()
     """
 
-    def __init__(self, marker_name=None):
+    def __init__(self, marker_name=None, scope='function'):
         self.marker_name = marker_name
+        self.scope = scope
 
     def __call__(self, fun):
         marker_name = self.marker_name or fun.__name__
+        scope = self.scope
 
         @pytest.fixture()
         @wraps(fun)
         def _inner(request, *args, **kwargs):
-            marker = request.node.get_marker(marker_name)
-            print(request.node)
-            return fun(request, *args, **dict(marker.kwargs, **kwargs))
+            options = _marker_kwargs(request.node, marker_name)
+            if scope == 'function':
+                return _setup_fixture(
+                    fun, request, args, dict(options, **kwargs),
+                    request.addfinalizer)
+            node = _scope_node(request, scope)
+            try:
+                cache = node._case_fixture_values
+            except AttributeError:
+                cache = node._case_fixture_values = {}
+            key = (fun, _options_key(options))
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+            _check_dependency_scopes(request, fun, scope, kwargs)
+            node.addfinalizer(lambda: cache.pop(key, None))
+            value = cache[key] = _setup_fixture(
+                fun, request, args, dict(options, **kwargs),
+                node.addfinalizer)
+            return value
 
         def options(*args, **kwargs):
             return getattr(pytest.mark, marker_name)(*args, **kwargs)
@@ -52,6 +201,191 @@ class fixture_with_options(object):
         return _inner
 
 
+def _marker_kwargs(node, name):
+    try:
+        get_marker = node.get_closest_marker
+    except AttributeError:  # pytest < 3.6
+        get_marker = node.get_marker
+    marker = get_marker(name)
+    return marker.kwargs if marker is not None else {}
+
+
+_SCOPE_NODES = {
+    'class': ('Class', 'Module'),
+    'module': ('Module',),
+    'package': ('Package',),
+}
+
+
+def _scope_node(request, scope):
+    # node that fixture values with scope are cached on.
+    for node_type in _SCOPE_NODES.get(scope, ()):
+        node_type = getattr(pytest, node_type, None)
+        node = node_type and request.node.getparent(node_type)
+        if node is not None:
+            return node
+    return request.session
+
+
+_SCOPES = ['function', 'class', 'module', 'package', 'session']
+
+#: Builtin fixtures known to be function scoped, used if the scope
+#: of fixtures cannot be found.
+_FUNCTION_FIXTURES = frozenset([
+    'capfd', 'capfdbinary', 'caplog', 'capsys', 'capsysbinary',
+    'monkeypatch', 'patching', 'recwarn', 'tmp_path', 'tmpdir',
+    'warnings_capture',
+])
+
+
+def _fixture_scope(request, name):
+    try:
+        fixturedefs = request._arg2fixturedefs.get(name)
+    except AttributeError:
+        fixturedefs = None
+    if not fixturedefs:
+        return 'function' if name in _FUNCTION_FIXTURES else None
+    return fixturedefs[-1].scope
+
+
+def _check_dependency_scopes(request, fun, scope, dependencies):
+    # the value outlives the test creating it, so it must not depend
+    # on fixtures torn down before the end of its own scope.
+    for name in dependencies:
+        dep_scope = _fixture_scope(request, name)
+        if (dep_scope in _SCOPES and
+                _SCOPES.index(dep_scope) < _SCOPES.index(scope)):
+            raise ValueError(
+                'fixture {0} with scope {1!r} cannot use {2!r} '
+                'scoped fixture {3}'.format(
+                    fun.__name__, scope, dep_scope, name))
+
+
+def _options_key(options):
+    key = tuple(sorted(items(options)))
+    try:
+        hash(key)
+    except TypeError:
+        return repr(key)
+    return key
+
+
+def _setup_fixture(fun, request, args, kwargs, addfinalizer):
+    if not inspect.isgeneratorfunction(fun):
+        return fun(request, *args, **kwargs)
+    gen = fun(request, *args, **kwargs)
+    value = next(gen)
+
+    def finalize():
+        try:
+            next(gen)
+        except StopIteration:
+            pass
+        else:
+            raise ValueError(
+                'fixture {0} yielded more than once'.format(fun.__name__))
+    addfinalizer(finalize)
+    return value
+
+
+class _LazyMock(mock.mock.NonCallableMock):
+    # Stands in for ``new(name=name)`` with attributes set from ``attrs``,
+    # creating it the first time it's used.  Subclasses NonCallableMock
+    # (without running its constructor) so that mock recognizes it as a
+    # mock, e.g. in ``attach_mock``, with every attribute forwarded.
+    __slots__ = ('_lazy_new', '_lazy_name', '_lazy_attrs', '_lazy_mock')
+
+    def __new__(cls, *args, **kwargs):
+        return object.__new__(cls)
+
+    def __init__(self, new, name, attrs):
+        object.__setattr__(self, '_lazy_new', new)
+        object.__setattr__(self, '_lazy_name', name)
+        object.__setattr__(self, '_lazy_attrs', attrs)
+        object.__setattr__(self, '_lazy_mock', None)
+
+    @property
+    def __class__(self):
+        # isinstance(value, MagicMock) should not create the mock.
+        return object.__getattribute__(self, '_lazy_new')
+
+    def __getattribute__(self, name):
+        if name == '__class__':
+            return object.__getattribute__(self, name)
+        return getattr(_materialize(self), name)
+
+    def __setattr__(self, name, value):
+        setattr(_materialize(self), name, value)
+
+    def __delattr__(self, name):
+        delattr(_materialize(self), name)
+
+    def __call__(self, *args, **kwargs):
+        return _materialize(self)(*args, **kwargs)
+
+    def __eq__(self, other):
+        if isinstance(other, _LazyMock):
+            other = _materialize(other)
+        return _materialize(self) == other
+
+    def __ne__(self, other):
+        if isinstance(other, _LazyMock):
+            other = _materialize(other)
+        return _materialize(self) != other
+
+    def __hash__(self):
+        return hash(_materialize(self))
+
+
+def _materialize(proxy):
+    value = object.__getattribute__(proxy, '_lazy_mock')
+    if value is None:
+        value = object.__getattribute__(proxy, '_lazy_new')(
+            name=object.__getattribute__(proxy, '_lazy_name'))
+        for k, v in items(object.__getattribute__(proxy, '_lazy_attrs')):
+            setattr(value, k, v)
+        object.__setattr__(proxy, '_lazy_mock', value)
+    return value
+
+
+#: Binary operators, returning NotImplemented if not supported
+#: so that the reflected operation of the other operand is tried.
+_BINARY_OPERATORS = frozenset(
+    prefix + name for name in (
+        'add sub mul matmul truediv floordiv div mod divmod '
+        'lshift rshift and xor or pow lt le gt ge'.split())
+    for prefix in ('', 'r', 'i'))
+
+
+def _lazy_method(name):
+
+    def method(self, *args):
+        value = _materialize(self)
+        try:
+            fun = getattr(value, name)
+        except AttributeError:  # not supported by this mock.
+            if name[2:-2] in _BINARY_OPERATORS:
+                return NotImplemented
+            if name in ('__bool__', '__nonzero__'):
+                return bool(value)
+            raise TypeError('{0!r} object does not support {1}'.format(
+                type(value).__name__, name))
+        return fun(*args)
+    method.__name__ = str(name)
+    return method
+
+
+# every magic method MagicMock supports, except those that would
+# change how the proxy itself is stored, copied or pickled.
+for _name in (set(mock.mock._all_magics) | set(['__await__'])) - set([
+        '__get__', '__set__', '__delete__', '__eq__', '__ne__', '__hash__',
+        '__getstate__', '__setstate__', '__reduce__', '__reduce_ex__',
+        '__getnewargs__', '__getnewargs_ex__', '__getinitargs__',
+        '__getformat__', '__subclasses__', '__missing__']):
+    setattr(_LazyMock, _name, _lazy_method(_name))
+del _name
+
+
 class _patching(object):
 
     def __init__(self, monkeypatch, request):
@@ -74,7 +408,13 @@ class _patching(object):
 
     def _value_or_mock(self, value, new, name, path, **kwargs):
         if value is sentinel:
-            value = new(name=name or path.rpartition('.')[2])
+            name = name or path.rpartition('.')[2]
+            if (isinstance(new, type) and
+                    issubclass(new, mock.mock.NonCallableMock)):
+                # most patches are never looked at, so only create
+                # the mock when it's actually used.
+                return _LazyMock(new, name, kwargs)
+            value = new(name=name)
         for k, v in items(kwargs):
             setattr(value, k, v)
         return value
@@ -127,6 +467,10 @@ def patching(monkeypatch, request):
 
             # val will be of type mock.MagicMock by default
             val = patching.setitem('path.to.dict', 'KEY')
+
+    Default mocks are only created when first used (called, attribute
+    accessed, operator applied, or attached to another mock), so unused
+    patches are cheap.
     """
     return _patching(monkeypatch, request)
 
@@ -141,3 +485,38 @@ class _stdouts(object):
 @pytest.fixture()
 def stdouts(request):
     return _stdouts(*_wrap_context(mock.stdouts(), request))
+
+
+@pytest.fixture()
+def warnings_capture(request):
+    """Warnings emitted by the test, indexed by category.
+
+    See :class:`case.utils.WarningsCapture`.
+
+    Example:
+        .. code-block:: python
+
+        def test_frobulate(warnings_capture):
+            frobulate()
+            assert warnings_capture.find(DeprecationWarning, 'frobulate')
+    """
+    return _wrap_context(WarningsCapture(), request)
+
+
+@pytest.fixture()
+def virtual_event_loop():
+    """Asyncio event loop using a virtual clock.
+
+    Set as the current event loop for the duration of the test,
+    see :func:`case.aio.virtual_event_loop`.
+
+    Example:
+        .. code-block:: python
+
+        def test_heartbeats(virtual_event_loop):
+            virtual_event_loop.run_until_complete(
+                heartbeat_for(hours=1))  # runs in milliseconds
+    """
+    from .aio import virtual_event_loop
+    with virtual_event_loop() as loop:
+        yield loop
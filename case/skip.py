@@ -1,18 +1,27 @@
 from __future__ import absolute_import, unicode_literals
 
+import atexit
+import hashlib
 import importlib
+import json
+import math
 import os
 import sys
+import time
 
-from nose import SkipTest
+try:
+    from unittest import SkipTest
+except ImportError:  # Python 2.6
+    from unittest2 import SkipTest  # noqa
 
-from .utils import decorator, symbol_by_name
+from .utils import cache_dir, find_module_spec, store_json, symbol_by_name
+from .utils import decorator as _decorator
 
 __all__ = [
     'todo',
     'if_darwin', 'unless_darwin',
-    'if_environ', 'unless_environ',
-    'if_module', 'unless_module',
+    'if_environ', 'unless_environ', 'if_slow',
+    'if_module', 'unless_module', 'module_available',
     'if_jython', 'unless_jython',
     'if_platform', 'unless_platform',
     'if_pypy', 'unless_pypy',
@@ -23,6 +32,36 @@ __all__ = [
 ]
 
 
+def _skipif_mark(predicate, pargs, pkwargs):
+    # evaluate the skip condition once, when the test is decorated
+    # (i.e. at collection time), so that pytest can skip the test
+    # before setting up its fixtures.
+    pytest = sys.modules.get('pytest')
+    if pytest is None:
+        return
+    try:
+        context = predicate(*pargs, **pkwargs)
+        next(context)
+    except SkipTest as exc:
+        return pytest.mark.skipif(True, reason=str(exc))
+    except Exception:
+        return  # leave it to be reported when the test runs.
+    # close without running the rest of the generator.
+    context.close()
+
+
+def decorator(predicate):
+    """Create skip decorator from context generator raising
+    :exc:`unittest.SkipTest` if the test should be skipped.
+
+    When running under pytest the decorator also adds an equivalent
+    :func:`pytest.mark.skipif` mark, so skipped tests never
+    set up their fixtures.
+
+    """
+    return _decorator(predicate, mark=_skipif_mark)
+
+
 @decorator
 def if_python_version_before(*version, **kwargs):
     """Skip test if Python version is less than ``*version``.
@@ -107,6 +146,163 @@ def unless_environ(env_var_name):
     yield
 
 
+_monotonic = getattr(time, 'monotonic', time.time)
+
+
+class TimingDatabase(object):
+    """Local database of test durations used by :func:`if_slow`.
+
+    Durations are stored per project and run profile, so that e.g.
+    timings from a CI machine do not decide what to skip on a laptop.
+    The project is identified by its root directory: the pytest
+    rootdir, or the current directory for other test runners.
+
+    Configured by the :envvar:`CASE_SLOW_BUDGET` and
+    :envvar:`CASE_RUN_PROFILE` environment variables, or the
+    ``--case-slow-budget`` and ``--case-run-profile`` pytest options.
+
+    """
+
+    #: Number of durations kept for every test.
+    max_samples = 50
+
+    #: Percentile of durations compared to the budget.
+    percentile = 95
+
+    def __init__(self, budget=None, profile=None, path=None, root=None):
+        self.budget = budget
+        self.profile = profile
+        self.root = root
+        self._path = path
+        self._history = None
+        self._new = {}
+        self._registered = False
+
+    def configure(self, budget=None, profile=None, root=None):
+        if budget is not None:
+            self.budget = float(budget)
+        if profile is not None:
+            self.profile = profile
+        if root is not None:
+            self.root = root
+
+    @property
+    def path(self):
+        if self._path is not None:
+            return self._path
+        root = os.path.abspath(self.root or os.getcwd())
+        return os.path.join(cache_dir('timings'), '{0}.json'.format(
+            hashlib.sha1(root.encode('utf-8')).hexdigest()))
+
+    @property
+    def run_profile(self):
+        return self.profile or 'default'
+
+    def _load(self):
+        try:
+            with open(self.path) as fh:
+                return json.load(fh)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def history(self, test):
+        if self._history is None:
+            self._history = self._load()
+        return (self._history.get(self.run_profile, {}).get(test, []) +
+                self._new.get(test, []))
+
+    def p95(self, test):
+        """Return the 95th percentile duration of test,
+        or :const:`None` if the test has not been timed before."""
+        durations = sorted(self.history(test))
+        if durations:
+            rank = int(math.ceil(self.percentile / 100.0 * len(durations)))
+            return durations[max(rank - 1, 0)]
+
+    def record(self, test, duration):
+        self._new.setdefault(test, []).append(duration)
+        if not self._registered:
+            self._registered = True
+            atexit.register(self.save)
+
+    def save(self):
+        if not self._new:
+            return
+        # merge with what other processes may have written since.
+        data = self._load()
+        profile = data.setdefault(self.run_profile, {})
+        for test, durations in self._new.items():
+            profile[test] = (
+                profile.get(test, []) + durations)[-self.max_samples:]
+        store_json(self.path, data)
+        self._history, self._new = data, {}
+
+
+timings = TimingDatabase(
+    budget=float(os.environ['CASE_SLOW_BUDGET'])
+    if os.environ.get('CASE_SLOW_BUDGET') else None,
+    profile=os.environ.get('CASE_RUN_PROFILE') or None,
+)
+
+
+def _test_name(obj):
+    return '{0}.{1}'.format(
+        obj.__module__, getattr(obj, '__qualname__', obj.__name__))
+
+
+@decorator
+def _if_slow(test, budget):
+    limit = budget if budget is not None else timings.budget
+    if timings.budget is not None and limit is not None:
+        p95 = timings.p95(test)
+        if p95 is not None and p95 > limit:
+            raise SkipTest(
+                'slow: p95 {0:.2f}s over budget of {1:.2f}s'.format(
+                    p95, limit))
+    time_start = _monotonic()
+    yield
+    # only reached if the test succeeds.
+    timings.record(test, _monotonic() - time_start)
+
+
+def if_slow(budget=None, name=None):
+    """Skip test if it has historically been slower than the budget.
+
+    The duration of every successful run of the test is recorded in a
+    local :class:`TimingDatabase`, and the test is skipped if the 95th
+    percentile of its durations in the current run profile is more
+    than ``budget`` seconds.
+
+    Tests are only ever skipped if the run has a budget, set using the
+    :envvar:`CASE_SLOW_BUDGET` environment variable or the
+    ``--case-slow-budget`` pytest option, which is also used as the
+    default ``budget``.  That way a fast pre-merge run can set
+    a budget, while a nightly run without one runs all tests.
+
+    :keyword budget: Budget in seconds for this test.
+    :keyword name: Name used to record the test.  Defaults to the
+        qualified name of the function or class decorated.
+
+    Example::
+
+        @skip.if_slow()
+        def test_full_sync(self):
+            ...
+
+        @skip.if_slow(budget=5.0)
+        class test_Integration(Case):
+            ...
+
+    """
+    def _decorate(fun):
+        return _if_slow(name or _test_name(fun), budget)(fun)
+
+    if callable(budget):
+        fun, budget = budget, None
+        return _decorate(fun)
+    return _decorate
+
+
 @decorator
 def _skip_test(reason, sign):
     raise SkipTest('{0}: {1}'.format(sign, reason))
@@ -127,20 +323,160 @@ def skip(reason):
     return _skip_test(reason, sign='SKIP')
 
 
+#: Process wide memo used by :func:`module_available`.
+_available_modules = {}
+_disk_cache = {}
+
+
+def _disk_cache_path():
+    # The cache is keyed by interpreter and sys.path, including the
+    # modification time of site directories so that installing or
+    # removing packages invalidates it.  Other directories (like the
+    # project itself) change too often for their mtime to be useful.
+    key = hashlib.sha1()
+    for part in [sys.executable, sys.version] + list(sys.path):
+        mtime = None
+        if os.path.basename(part) in ('site-packages', 'dist-packages'):
+            try:
+                mtime = os.stat(part).st_mtime
+            except OSError:
+                pass
+        key.update('{0}\0{1}\0'.format(part, mtime).encode('utf-8'))
+    return os.path.join(
+        cache_dir('modules'), '{0}.json'.format(key.hexdigest()))
+
+
+def _load_disk_cache():
+    path = _disk_cache_path()
+    if path not in _disk_cache:
+        try:
+            with open(path) as fh:
+                _disk_cache[path] = json.load(fh)
+        except (IOError, OSError, ValueError):
+            _disk_cache[path] = {}
+    return path, _disk_cache[path]
+
+
+def _masked(module):
+    # modules masked by case.mock.mask_modules can not be found,
+    # whatever was memoized before they were masked.
+    mock = sys.modules.get('case.mock')
+    if mock is not None:
+        for finder in sys.meta_path:
+            if (isinstance(finder, mock._MaskedModuleFinder) and
+                    finder.masks(module)):
+                return True
+    return False
+
+
+#: Set if modules are found using import specs (Python 3.4+).
+_HAS_SPECS = sys.version_info >= (3, 4)
+
+
+def _find_module_imp(module):
+    # Python 2 has no import specs, and nothing on sys.meta_path
+    # for the standard import system, so search for the module
+    # like :func:`imp.find_module` does, one package at a time.
+    import imp
+    if module in sys.modules:
+        return sys.modules[module] is not None
+    parts = module.split('.')
+    path = None
+    for i, part in enumerate(parts):
+        parent = sys.modules.get('.'.join(parts[:i])) if i else None
+        if parent is not None:
+            path = getattr(parent, '__path__', None)
+            if path is None:  # parent is not a package
+                return False
+        try:
+            fh, filename, description = imp.find_module(part, path)
+        except ImportError:
+            return False
+        if fh is not None:
+            fh.close()
+        if i < len(parts) - 1:
+            if description[2] != imp.PKG_DIRECTORY:
+                return False
+            path = [filename]
+    return True
+
+
+def _find_module(module):
+    # raises ImportError if an import hook refused to find the module.
+    if _HAS_SPECS:
+        return find_module_spec(module) is not None
+    return _find_module_imp(module)
+
+
+def _find_available(module):
+    try:
+        return _find_module(module)
+    except (ImportError, ValueError):
+        return False
+
+
+def module_available(module, cache=False):
+    """Return :const:`True` if ``module`` can be found on the
+    module search path, without importing it.
+
+    The result is memoized for the rest of the process (for as long as
+    :data:`sys.path` stays the same), and if ``cache`` is set also
+    stored on disk (see :func:`case.utils.cache_dir`).  Modules in
+    :data:`sys.modules`, and modules an import hook refused to find
+    (e.g. in :func:`case.mock.mask_modules`), are not memoized.
+
+    Note that this only checks that the module exists, not that
+    importing it would succeed.
+
+    """
+    if _masked(module):
+        return False
+    if module in sys.modules:
+        return _find_available(module)
+    key = (module, tuple(sys.path))
+    try:
+        return _available_modules[key]
+    except KeyError:
+        pass
+    if cache:
+        path, entries = _load_disk_cache()
+        if module in entries:
+            available = _available_modules[key] = entries[module]
+            return available
+    try:
+        available = _find_module(module)
+    except (ImportError, ValueError):
+        return False
+    _available_modules[key] = available
+    if cache:
+        entries[module] = available
+        store_json(path, entries)
+    return available
+
+
 @decorator
-def if_module(module, name=None, import_errors=(ImportError,)):
+def if_module(module, name=None, import_errors=(ImportError,),
+              fast=False, cache=False):
     """Skip test if ``module`` can be imported.
 
     :param module: Module to import.
     :keyword name: Alternative module name to use in reason.
     :keyword import_errors: Tuple of import errors to check for.
         Default is ``(ImportError,)``.
+    :keyword fast: Only check that the module can be found,
+        without importing it.  See :func:`module_available`.
+    :keyword cache: With ``fast``, also cache the result on disk.
 
     Example::
 
         @skip.if_module('librabbitmq')
 
     """
+    if fast:
+        if module_available(module, cache=cache):
+            raise SkipTest('module available: {0}'.format(name or module))
+        yield
+        return
     try:
         importlib.import_module(module)
     except import_errors:
@@ -151,19 +487,29 @@ def if_module(module, name=None, import_errors=(ImportError,)):
 
 
 @decorator
-def unless_module(module, name=None, import_errors=(ImportError,)):
+def unless_module(module, name=None, import_errors=(ImportError,),
+                  fast=False, cache=False):
     """Skip test if ``module`` can not be imported.
 
     :param module: Module to import.
     :keyword name: Alternative module name to use in reason.
     :keyword import_errors: Tuple of import errors to check for.
         Default is ``(ImportError,)``.
+    :keyword fast: Only check that the module can be found,
+        without importing it.  See :func:`module_available`.
+    :keyword cache: With ``fast``, also cache the result on disk.
 
     Example::
 
-        @skip.unless_module('librabbitmq')
+        @skip.unless_module('librabbitmq', fast=True)
 
     """
+    if fast:
+        if not module_available(module, cache=cache):
+            raise SkipTest('module not installed: {0}'.format(
+                name or module))
+        yield
+        return
     try:
         importlib.import_module(module)
     except import_errors:
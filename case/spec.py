@@ -0,0 +1,285 @@
+from __future__ import absolute_import, unicode_literals
+
+import ast
+import inspect
+import json
+import os
+import sys
+import types
+
+from .mock import Mock
+from .utils import cache_dir, find_module_spec, store_json
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock  # noqa
+
+__all__ = ['static_module_spec', 'StaticSpecModule']
+
+#: Bump when the format of cached specs change.
+SPEC_FORMAT = 1
+
+_DECORATORS = {
+    'staticmethod': staticmethod,
+    'classmethod': classmethod,
+    'property': property,
+}
+
+_PARAMETER_KINDS = {
+    'posonlyargs': 'POSITIONAL_ONLY',
+    'args': 'POSITIONAL_OR_KEYWORD',
+    'kwonlyargs': 'KEYWORD_ONLY',
+}
+
+
+class _Default(object):
+    # stands in for a default value that is not a literal.
+
+    def __init__(self, source):
+        self.source = source
+
+    def __repr__(self):
+        return self.source
+
+
+def _default(node):
+    try:
+        value = ast.literal_eval(node)
+        json.dumps(value)
+    except (ValueError, TypeError, SyntaxError):
+        unparse = getattr(ast, 'unparse', None)
+        return {'source': unparse(node) if unparse else '...'}
+    return {'value': value}
+
+
+def _signature(args):
+    # describe ast.arguments as a JSON serializable list of parameters.
+    params = []
+    for field in ('posonlyargs', 'args'):
+        for arg in getattr(args, field, None) or []:
+            params.append([arg.arg, _PARAMETER_KINDS[field], None])
+    defaults = args.defaults
+    if defaults:
+        for param, node in zip(params[-len(defaults):], defaults):
+            param[2] = _default(node)
+    if args.vararg is not None:
+        params.append([args.vararg.arg, 'VAR_POSITIONAL', None])
+    for arg, node in zip(args.kwonlyargs, args.kw_defaults):
+        params.append([
+            arg.arg, 'KEYWORD_ONLY',
+            _default(node) if node is not None else None])
+    if args.kwarg is not None:
+        params.append([args.kwarg.arg, 'VAR_KEYWORD', None])
+    return params
+
+
+def _iter_body(body):
+    # statements executed at import time, including those
+    # inside if/try/with blocks.
+    for node in body:
+        yield node
+        for field in ('body', 'orelse', 'finalbody'):
+            if not isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                for child in _iter_body(getattr(node, field, None) or []):
+                    yield child
+        for handler in getattr(node, 'handlers', None) or []:
+            for child in _iter_body(handler.body):
+                yield child
+
+
+def _target_names(target):
+    if isinstance(target, ast.Name):
+        yield target.id
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        for elt in target.elts:
+            for name in _target_names(elt):
+                yield name
+
+
+def _decorator_names(node):
+    names = set()
+    for decorator in node.decorator_list:
+        if isinstance(decorator, ast.Name):
+            names.add(decorator.id)
+        elif isinstance(decorator, ast.Attribute):
+            names.add(decorator.attr)
+    return names
+
+
+def _describe(body, classes=None):
+    names = {}
+    for node in _iter_body(body):
+        if isinstance(node, (ast.FunctionDef,
+                             getattr(ast, 'AsyncFunctionDef', ()))):
+            decorators = _decorator_names(node)
+            kind = 'function'
+            for special in _DECORATORS:
+                if special in decorators:
+                    kind = special
+            names[node.name] = {
+                'kind': kind, 'signature': _signature(node.args)}
+        elif isinstance(node, ast.ClassDef):
+            attrs = {}
+            bases = [getattr(base, 'id', None) for base in node.bases]
+            open_ = False
+            for base in bases:
+                if classes is not None and base in classes:
+                    attrs.update(classes[base]['attrs'])
+                    open_ = open_ or classes[base]['open']
+                elif base != 'object':
+                    # inherits attributes we cannot know about
+                    # without importing the base class.
+                    open_ = True
+            attrs.update(_describe(node.body))
+            names[node.name] = {'kind': 'class', 'attrs': attrs,
+                                'open': open_}
+            if classes is not None:
+                classes[node.name] = names[node.name]
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                for name in _target_names(target):
+                    names[name] = {'kind': 'attribute'}
+        elif isinstance(node, (getattr(ast, 'AnnAssign', ()),
+                               ast.AugAssign)):
+            for name in _target_names(node.target):
+                names[name] = {'kind': 'attribute'}
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                name = alias.asname or alias.name.partition('.')[0]
+                names[name] = {'kind': 'attribute'}
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if alias.name != '*':
+                    names[alias.asname or alias.name] = {'kind': 'attribute'}
+    return names
+
+
+def parse_module_spec(source, filename='<unknown>'):
+    """Describe the names defined by module source code,
+    without executing it."""
+    return _describe(ast.parse(source, filename).body, classes={})
+
+
+def _spec_origin(name):
+    spec = find_module_spec(name)
+    origin = getattr(spec, 'origin', None)
+    if not origin or not origin.endswith('.py'):
+        raise ImportError(
+            'Cannot find Python source for module {0!r}'.format(name))
+    return origin
+
+
+def static_module_spec(name, cache=True):
+    """Return description of the names defined by module,
+    found by parsing its source code without importing it.
+
+    The result is cached on disk (see :func:`case.utils.cache_dir`),
+    and is valid for as long as the modification time of the
+    source file stays the same.
+
+    :raises ImportError: if the source of the module is not found.
+
+    """
+    path = _spec_origin(name)
+    mtime = os.stat(path).st_mtime
+    cached = os.path.join(cache_dir('spec'), '{0}.json'.format(name))
+    if cache:
+        try:
+            with open(cached) as fh:
+                entry = json.load(fh)
+        except (IOError, OSError, ValueError):
+            pass
+        else:
+            if (entry.get('format') == SPEC_FORMAT and
+                    entry.get('path') == path and
+                    entry.get('mtime') == mtime):
+                return entry['names']
+    with open(path, 'rb') as fh:
+        names = parse_module_spec(fh.read(), path)
+    if cache:
+        store_json(cached, {'format': SPEC_FORMAT, 'path': path,
+                            'mtime': mtime, 'names': names})
+    return names
+
+
+def _stub_function(name, params):
+    parameters = []
+    for param_name, kind, default in params:
+        if default is None:
+            default = inspect.Parameter.empty
+        elif 'value' in default:
+            default = default['value']
+        else:
+            default = _Default(default['source'])
+        parameters.append(inspect.Parameter(
+            param_name, getattr(inspect.Parameter, kind), default=default))
+
+    def stub(*args, **kwargs):
+        pass
+    stub.__name__ = str(name)
+    stub.__signature__ = inspect.Signature(parameters)
+    return stub
+
+
+def _stub_class(name, attrs):
+    namespace = {}
+    for attr, desc in attrs.items():
+        kind = desc['kind']
+        if kind == 'attribute':
+            namespace[attr] = None
+        elif kind == 'class':
+            namespace[attr] = _stub(attr, desc)
+        else:
+            fun = _stub_function(attr, desc['signature'])
+            if kind in _DECORATORS:
+                fun = _DECORATORS[kind](fun)
+            namespace[attr] = fun
+    return type(str(name), (object,), namespace)
+
+
+def _stub(name, desc):
+    kind = desc['kind']
+    if kind == 'class':
+        return _stub_class(name, desc['attrs'])
+    elif kind == 'attribute':
+        return None
+    return _stub_function(name, desc['signature'])
+
+
+class StaticSpecModule(types.ModuleType):
+    """Mock module restricted to the names defined by the real module.
+
+    Functions and classes are autospecced from stubs built from
+    :func:`static_module_spec`, so calls with the wrong signature
+    fail.  Other names are plain :class:`~case.mock.Mock` objects.
+    Accessing a name not defined by the real module raises
+    :exc:`AttributeError`.
+
+    """
+
+    def __init__(self, name, names=None):
+        super(StaticSpecModule, self).__init__(name)
+        if names is None:
+            names = static_module_spec(name)
+        self.__spec_names__ = names
+
+    def __getattr__(self, attr):
+        submodule = sys.modules.get('{0}.{1}'.format(self.__name__, attr))
+        if submodule is not None:
+            return submodule
+        try:
+            desc = self.__spec_names__[attr]
+        except KeyError:
+            raise AttributeError(
+                'module {0!r} has no attribute {1!r}'.format(
+                    self.__name__, attr))
+        if desc['kind'] == 'attribute' or desc.get('open'):
+            value = Mock(name=attr)
+        else:
+            value = mock.create_autospec(_stub(attr, desc))
+        setattr(self, attr, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self.__spec_names__))
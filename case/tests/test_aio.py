@@ -0,0 +1,31 @@
+from __future__ import absolute_import, unicode_literals
+
+from case import Case, skip
+
+
+@skip.if_python_version_before(3, 4)
+class test_virtual_event_loop(Case):
+
+    def setup(self):
+        import asyncio
+        self.asyncio = asyncio
+        self.prev = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.prev)
+
+    def teardown(self):
+        self.asyncio.set_event_loop(None)
+        self.prev.close()
+
+    def test_set_and_restored(self):
+        from case.aio import virtual_event_loop
+        with virtual_event_loop() as loop:
+            self.assertIs(self.asyncio.get_event_loop(), loop)
+        self.assertTrue(loop.is_closed())
+        self.assertIs(self.asyncio.get_event_loop(), self.prev)
+
+    def test_case_helper(self):
+        loop = self.virtual_event_loop()
+        self.assertIs(self.asyncio.get_event_loop(), loop)
+        self.doCleanups()
+        self.assertTrue(loop.is_closed())
+        self.assertIs(self.asyncio.get_event_loop(), self.prev)
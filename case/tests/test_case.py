@@ -0,0 +1,69 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import subprocess
+import sys
+import time
+import unittest
+import warnings
+
+import case
+from case import Case, mock
+
+
+class test_lazy_attributes(Case):
+
+    def assertImports(self, source):
+        subprocess.check_call(
+            [sys.executable, '-c', source],
+            cwd=os.path.dirname(os.path.dirname(case.__file__)))
+
+    def test_submodules(self):
+        self.assertImports(
+            'import case; case.utils.WhateverIO; case.case.Case; '
+            'case.mock.Mock; case.skip.todo')
+
+    def test_attributes(self):
+        self.assertImports(
+            'from case import Case, Mock, patch, VERSION, mock, skip')
+
+
+class test_assertWarns(Case):
+
+    def test_warnings_list(self):
+        with self.assertWarns(UserWarning) as cm:
+            warnings.warn(UserWarning('frobulate'))
+        self.assertEqual(str(cm.warnings[0].message), 'frobulate')
+        self.assertIs(cm.warnings[0].category, UserWarning)
+        self.assertEqual(str(cm.warning), 'frobulate')
+
+    def test_other_categories_not_recorded(self):
+        with self.assertWarnsRegex(UserWarning, 'frobulate') as cm:
+            warnings.warn(DeprecationWarning('old'))
+            warnings.warn(UserWarning('frobulate'))
+        self.assertEqual(len(cm.warnings), 1)
+
+
+class test_phase_timings(Case):
+
+    def test_leak_check_not_timed(self):
+        if not case.case._HAS_PHASE_METHODS:
+            raise self.skipTest('Python 3.8+')
+        from case.timing import PhaseTimer
+        timer = PhaseTimer(report=os.devnull)
+        timer._registered = True  # no report at exit
+        checker = mock.Mock(name='checker', external=False)
+        checker.report.side_effect = lambda sample: time.sleep(0.2)
+        self.patch('case.case.timer', new=timer)
+        self.patch('case.case.checker', new=checker)
+
+        class test_Inner(Case):
+
+            def test_fun(self):
+                pass
+        result = unittest.TestResult()
+        test_Inner('test_fun').run(result)
+        self.assertTrue(result.wasSuccessful())
+        checker.report.assert_called_once_with(checker.start.return_value)
+        (phases,) = timer.tests.values()
+        self.assertLess(phases['cleanup'], 0.1)
@@ -0,0 +1,24 @@
+from __future__ import absolute_import, unicode_literals
+
+import time
+
+from case import Case, mock
+from case.clock import VirtualClock
+
+
+class test_VirtualClock(Case):
+
+    def test_ns(self):
+        clock = VirtualClock(start=1000.0)
+        monotonic_ns = clock.monotonic_ns()
+        clock.sleep(1.5)
+        self.assertEqual(clock.monotonic_ns() - monotonic_ns, 1500000000)
+        self.assertEqual(clock.perf_counter_ns(), clock.monotonic_ns())
+        self.assertEqual(clock.time_ns(), 1001500000000)
+
+    def test_patches_ns_functions(self):
+        if not hasattr(time, 'time_ns'):
+            raise self.skipTest('Python 3.7+')
+        with mock.virtual_clock() as clock:
+            self.assertEqual(time.time_ns(), clock.time_ns())
+            self.assertEqual(time.monotonic_ns(), clock.monotonic_ns())
@@ -0,0 +1,92 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+
+from case import Case, mock
+
+PACKAGE = {
+    '__init__.py': '',
+    'helper.py': 'VALUE = 1\n',
+    'plain.py': (
+        'from case_sandbox_pkg import helper\n'
+        'X = (1, 2)\n\n\n'
+        'def value():\n'
+        '    return helper.VALUE\n'
+    ),
+    'stateful.py': (
+        'REG = {}\n\n\n'
+        'class Registry(object):\n'
+        '    items = []\n'
+    ),
+}
+
+
+class test_import_sandbox(Case):
+
+    def test_imported_after_restore(self):
+        with mock.import_sandbox():
+            sys.modules.pop('colorsys', None)
+            with mock.import_sandbox() as sandbox:
+                import colorsys  # noqa
+            self.assertNotIn('colorsys', sys.modules)
+            self.assertIn('colorsys', sandbox.imported)
+
+    def test_replaced_after_restore(self):
+        prev = sys.modules['json']
+        with mock.import_sandbox() as sandbox:
+            sys.modules['json'] = object()
+        self.assertIs(sys.modules['json'], prev)
+        self.assertEqual(sandbox.replaced, set(['json']))
+
+
+class test_import_sandbox_fresh(Case):
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, 'case_sandbox_pkg')
+        os.mkdir(path)
+        for filename, source in PACKAGE.items():
+            with open(os.path.join(path, filename), 'w') as fh:
+                fh.write(source)
+        sys.path.insert(0, self.tmpdir)
+        self.sandbox = mock.import_sandbox()
+        self.sandbox.__enter__()
+
+    def teardown(self):
+        self.sandbox.__exit__(None, None, None)
+        sys.path.remove(self.tmpdir)
+        shutil.rmtree(self.tmpdir)
+        for name in list(mock._pristine_modules):
+            if name.startswith('case_sandbox_pkg'):
+                del mock._pristine_modules[name]
+
+    def fresh(self, name, **kwargs):
+        with mock.import_sandbox(name, **kwargs):
+            return sys.modules[name]
+
+    def test_not_cached_by_default(self):
+        first = self.fresh('case_sandbox_pkg.plain')
+        self.assertIsNot(self.fresh('case_sandbox_pkg.plain'), first)
+
+    def test_cached(self):
+        name = 'case_sandbox_pkg.plain'
+        first = self.fresh(name, cache=True)
+        with mock.import_sandbox(name, cache=True):
+            plain = sys.modules[name]
+            self.assertIs(plain, first)
+            self.assertIs(plain.helper, sys.modules['case_sandbox_pkg.helper'])
+            self.assertEqual(plain.value(), 1)
+
+    def test_mutable_state_not_cached(self):
+        name = 'case_sandbox_pkg.stateful'
+        with mock.import_sandbox(name, cache=True):
+            stateful = sys.modules[name]
+            stateful.REG['x'] = 1
+            stateful.Registry.items.append(1)
+        with mock.import_sandbox(name, cache=True):
+            stateful = sys.modules[name]
+            self.assertEqual(stateful.REG, {})
+            self.assertEqual(stateful.Registry.items, [])
@@ -0,0 +1,118 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import case
+from case import Case, mock
+from case.pytest import _patching, sentinel
+
+FIXTURE_SCOPES = '''
+from case.pytest import fixture_with_options
+
+
+@fixture_with_options(scope='module')
+def shared(request, x=1):
+    return object()
+
+
+@fixture_with_options(scope='module')
+def leaky(request, tmp_path, x=1):
+    return tmp_path
+
+
+@shared.options(x=2)
+def test_shared(shared):
+    global first
+    first = shared
+
+
+@shared.options(x=2)
+def test_shared_same_options(shared):
+    assert shared is first
+
+
+@shared.options(x=3)
+def test_shared_other_options(shared):
+    assert shared is not first
+
+
+def test_leaky(leaky):
+    pass
+'''
+
+
+class test_fixture_with_options(Case):
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_pytest(self, source):
+        path = os.path.join(self.tmpdir, 'test_fixtures.py')
+        with open(path, 'w') as fh:
+            fh.write(source)
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(
+            os.path.dirname(case.__file__)))
+        p = subprocess.Popen(
+            [sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider',
+             path],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+        return p.communicate()[0].decode('utf-8')
+
+    def test_scope(self):
+        output = self.run_pytest(FIXTURE_SCOPES)
+        self.assertIn('3 passed', output)
+        self.assertIn('1 error', output)
+        self.assertIn(
+            "fixture leaky with scope 'module' cannot use "
+            "'function' scoped fixture tmp_path", output)
+
+
+class test_patching(Case):
+
+    def lazy(self, path='tgt.a', new=mock.MagicMock):
+        return _patching(None, None)._value_or_mock(sentinel, new, None, path)
+
+    def test_mock_created_lazily(self):
+        value = self.lazy()
+        self.assertIsInstance(value, mock.MagicMock)
+        self.assertIsNone(object.__getattribute__(value, '_lazy_mock'))
+        value.return_value = 3
+        self.assertEqual(value(), 3)
+        value.assert_called_once_with()
+
+    def test_attach_mock(self):
+        manager = mock.MagicMock()
+        a, b = self.lazy('tgt.a'), self.lazy('tgt.b')
+        manager.attach_mock(a, 'a')
+        manager.attach_mock(b, 'b')
+        a()
+        b()
+        self.assertEqual(manager.mock_calls, [mock.call.a(), mock.call.b()])
+
+    def test_operators(self):
+        value = self.lazy()
+        for result in (value + 1, 1 + value, value * 2, -value, abs(value),
+                       value[0], next(value), divmod(value, 2)):
+            self.assertIsInstance(result, mock.MagicMock)
+        self.assertEqual(len(value), 0)
+        self.assertEqual(int(value), 1)
+        self.assertTrue(value)
+        if hasattr(os, 'fspath'):  # Python 3.6+
+            self.assertIn('MagicMock', os.fspath(value))
+        value += 1
+        self.assertIsInstance(value, mock.MagicMock)
+
+    def test_operators_not_supported(self):
+        value = self.lazy(new=mock.Mock)
+        self.assertTrue(value)
+        with self.assertRaises(TypeError):
+            value + 1
+        with self.assertRaises(TypeError):
+            len(value)
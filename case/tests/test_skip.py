@@ -0,0 +1,63 @@
+from __future__ import absolute_import, unicode_literals
+
+import shutil
+import tempfile
+import unittest
+
+from case import Case, mock, skip
+
+
+class test_module_available(Case):
+
+    def test_not_memoized_while_masked(self):
+        with mock.mask_modules('wave'):
+            self.assertFalse(skip.module_available('wave'))
+        self.assertTrue(skip.module_available('wave'))
+        with mock.mask_modules('wave'):
+            self.assertFalse(skip.module_available('wave'))
+
+    def test_not_memoized_while_mocked(self):
+        with mock.module('xml.dom.minidom'):
+            self.assertTrue(skip.module_available('xml.dom.minidom'))
+        self.assertTrue(skip.module_available('xml.dom.minidom'))
+
+    def test_missing(self):
+        self.assertFalse(skip.module_available('case.does_not_exist'))
+        self.assertFalse(skip.module_available('os.path.does_not_exist'))
+
+
+class test_skipif_mark(Case):
+
+    def test_no_mark_unless_skipped(self):
+        self.assertIsNone(skip._skipif_mark(
+            skip.if_environ.__wrapped__, ('CASE_TEST_UNSET_VAR',), {}))
+
+
+class test_SkipTest(Case):
+
+    def test_unittest_skip(self):
+        with mock.environ('CASE_TEST_SET_VAR', '1'):
+            with self.assertRaises(unittest.SkipTest):
+                with skip.if_environ('CASE_TEST_SET_VAR'):
+                    pass
+        self.assertIs(skip.SkipTest, unittest.SkipTest)
+
+
+class test_TimingDatabase(Case):
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.mock_environ('CASE_CACHE_DIR', self.tmpdir)
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_per_project(self):
+        a = skip.TimingDatabase(root='/projects/a')
+        b = skip.TimingDatabase(root='/projects/b')
+        a.record('tests.test_app.test_main', 5.0)
+        a.save()
+        a.record('tests.test_app.test_main', 6.0)
+        a.save()
+        self.assertEqual(a.p95('tests.test_app.test_main'), 6.0)
+        self.assertIsNone(b.p95('tests.test_app.test_main'))
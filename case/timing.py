@@ -0,0 +1,261 @@
+from __future__ import absolute_import, unicode_literals
+
+import atexit
+import json
+import os
+import re
+import sys
+import time
+
+__all__ = ['PhaseTimer', 'timer']
+
+_monotonic = getattr(time, 'monotonic', time.time)  # before patched
+
+
+class _NoopContext(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_noop = _NoopContext()
+
+
+def _context_name(context):
+    # name of context manager, or of the function creating it.
+    fun = getattr(context, 'func', None) or context
+    name = (getattr(fun, '__qualname__', None) or
+            getattr(fun, '__name__', None) or type(context).__name__)
+    module = getattr(fun, '__module__', None)
+    return '{0}.{1}'.format(module, name) if module else name
+
+
+class _Phase(object):
+
+    def __init__(self, timer, test, name):
+        self.timer = timer
+        self.test = test
+        self.name = name
+        self.nested = False
+        self.excluded = 0.0
+
+    def __enter__(self):
+        stack = self.timer._stack
+        if stack:
+            # e.g. Case phases inside the pytest call phase: the inner
+            # phases are recorded, under the name of the outer test.
+            stack[-1].nested = True
+            self.test = stack[-1].test
+        stack.append(self)
+        self.start = _monotonic()
+
+    def __exit__(self, *exc_info):
+        duration = _monotonic() - self.start - self.excluded
+        self.timer._stack.remove(self)
+        if not self.nested:
+            self.timer.record(self.test, self.name, duration)
+
+
+class _Exclude(object):
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def __enter__(self):
+        self.start = _monotonic()
+
+    def __exit__(self, *exc_info):
+        duration = _monotonic() - self.start
+        for phase in self.timer._stack:
+            phase.excluded += duration
+
+
+class _Context(object):
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = _monotonic()
+
+    def __exit__(self, *exc_info):
+        self.timer.record_context(self.name, _monotonic() - self.start)
+
+
+class _Profile(object):
+
+    def __init__(self, timer, test):
+        self.timer = timer
+        self.test = test
+        self.profile = None
+
+    def __enter__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.timer._profiling = True
+        self.profile.enable()
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        self.timer._profiling = False
+        if not os.path.isdir(self.timer.cprofile):
+            os.makedirs(self.timer.cprofile)
+        self.profile.dump_stats(os.path.join(
+            self.timer.cprofile,
+            re.sub(r'[^\w.-]+', '_', self.test).strip('_') + '.prof'))
+
+
+class PhaseTimer(object):
+    """Records how long the setup, call and teardown phases of tests
+    take, and how long it takes to enter and exit the contexts of
+    decorators applied to test classes.
+
+    Enabled by setting the :envvar:`CASE_TIMINGS` environment variable,
+    or the ``--case-timings`` pytest option, to the path of the JSON
+    report to write when the tests finish.  A summary of the slowest
+    tests and contexts is also written to the terminal, the number of
+    which is set by :envvar:`CASE_TIMINGS_TOP` (``--case-timings-top``).
+
+    If :envvar:`CASE_CPROFILE` (``--case-cprofile``) is set to a
+    directory, the call phase of every test is also profiled
+    with :mod:`cProfile`, and the stats saved as ``<test>.prof``.
+
+    """
+
+    def __init__(self, report=None, top=10, cprofile=None):
+        self.report = report
+        self.top = top
+        self.cprofile = cprofile
+        self.tests = {}
+        self.contexts = {}
+        self._stack = []
+        self._profiling = False
+        self._registered = False
+        self._finished = False
+
+    def configure(self, report=None, top=None, cprofile=None):
+        if report is not None:
+            self.report = report
+        if top is not None:
+            self.top = int(top)
+        if cprofile is not None:
+            self.cprofile = cprofile
+
+    @property
+    def enabled(self):
+        return bool(self.report or self.cprofile)
+
+    def phase(self, test, name):
+        """Context timing phase ``name`` of ``test``."""
+        if not self.enabled:
+            return _noop
+        return _Phase(self, test, name)
+
+    def exclude(self):
+        """Context excluding the time spent in it
+        from the phases being timed."""
+        if not self._stack:
+            return _noop
+        return _Exclude(self)
+
+    def context(self, context):
+        """Context timing entering or exiting ``context``,
+        a context manager or the function creating it."""
+        if not self.enabled:
+            return _noop
+        return _Context(self, _context_name(context))
+
+    def profile(self, test):
+        """Context profiling ``test`` if :attr:`cprofile` is set."""
+        if not self.cprofile or self._profiling:
+            return _noop
+        if self._stack:
+            test = self._stack[0].test
+        return _Profile(self, test)
+
+    def record(self, test, phase, duration):
+        phases = self.tests.setdefault(test, {})
+        phases[phase] = phases.get(phase, 0.0) + duration
+        if not self._registered:
+            self._registered = True
+            atexit.register(self._atexit)
+
+    def record_context(self, name, duration):
+        count, total, longest = self.contexts.get(name, (0, 0.0, 0.0))
+        self.contexts[name] = (
+            count + 1, total + duration, max(longest, duration))
+
+    def slowest(self, n=None):
+        """Return list of ``(total, test, phases)`` tuples
+        for the ``n`` slowest tests."""
+        tests = sorted(
+            ((sum(phases.values()), test, phases)
+             for test, phases in self.tests.items()),
+            key=lambda t: t[0], reverse=True)
+        return tests[:n] if n is not None else tests
+
+    def slowest_contexts(self, n=None):
+        """Return list of ``(total, name, count, longest)`` tuples
+        for the ``n`` contexts taking the most time in total."""
+        contexts = sorted(
+            ((total, name, count, longest)
+             for name, (count, total, longest) in self.contexts.items()),
+            key=lambda t: t[0], reverse=True)
+        return contexts[:n] if n is not None else contexts
+
+    def summary(self, n=None):
+        """Return lines summarizing the ``n`` slowest tests
+        and contexts."""
+        n = self.top if n is None else n
+        lines = ['slowest {0} tests:'.format(n)]
+        for total, test, phases in self.slowest(n):
+            lines.append('  {0:8.3f}s  {1} ({2})'.format(
+                total, test, ', '.join(
+                    '{0} {1:.3f}s'.format(phase, phases[phase])
+                    for phase in sorted(phases))))
+        if self.contexts:
+            lines.append('slowest {0} contexts:'.format(n))
+            for total, name, count, longest in self.slowest_contexts(n):
+                lines.append(
+                    '  {0:8.3f}s  {1} ({2} times, longest {3:.3f}s)'.format(
+                        total, name, count, longest))
+        return lines
+
+    def save(self, path=None):
+        """Write the JSON report."""
+        path = path or self.report
+        with open(path, 'w') as fh:
+            json.dump({
+                'tests': self.tests,
+                'contexts': dict(
+                    (name, {'count': count, 'total': total, 'max': longest})
+                    for name, (count, total, longest)
+                    in self.contexts.items()),
+            }, fh, indent=2, sort_keys=True)
+
+    def finish(self):
+        """Save the report, and return the summary lines
+        (only the first time called)."""
+        if self._finished or not self.tests:
+            return []
+        self._finished = True
+        if self.report:
+            self.save()
+        return self.summary()
+
+    def _atexit(self):
+        lines = self.finish()
+        if lines:
+            sys.stderr.write('\n'.join(lines) + '\n')
+
+
+#: Timer used by :class:`case.Case` and the pytest plugin.
+timer = PhaseTimer(
+    report=os.environ.get('CASE_TIMINGS') or None,
+    top=int(os.environ.get('CASE_TIMINGS_TOP') or 10),
+    cprofile=os.environ.get('CASE_CPROFILE') or None,
+)
@@ -4,16 +4,25 @@ import functools
 import importlib
 import inspect
 import io
+import json
 import logging
+import os
+import re
 import sys
+import threading
+import time
 import unittest
+import warnings
 
 from contextlib import contextmanager
 from six import reraise, string_types
 
+from .timing import timer
+
 __all__ = [
-    'WhateverIO', 'decorator', 'get_logger_handlers',
-    'noop', 'symbol_by_name',
+    'CapturedIO', 'LogCapture', 'WhateverIO', 'decorator',
+    'get_logger_handlers', 'noop', 'symbol_by_name',
+    'find_module_spec', 'cache_dir', 'store_json', 'WarningsCapture',
 ]
 
 StringIO = io.StringIO
@@ -70,7 +79,8 @@ def augment_setup(orig_setup, context, pargs, pkwargs):
         except AttributeError:
             contexts = self.__rb3dc_contexts = []
         p = context(*pargs, **pkwargs)
-        p.__enter__()
+        with timer.context(context):
+            p.__enter__()
         contexts.append(p)
         if orig_setup:
             return orig_setup(self, *args, **kwargs)
@@ -88,7 +98,8 @@ def augment_teardown(orig_teardown, context, pargs, pkwargs):
             pass
         else:
             for context in contexts:
-                context.__exit__(*sys.exc_info())
+                with timer.context(context):
+                    context.__exit__(*sys.exc_info())
         if orig_teardown:
             orig_teardown(self, *args, **kwargs)
     if orig_teardown:
@@ -97,7 +108,18 @@ def augment_teardown(orig_teardown, context, pargs, pkwargs):
     return around_teardown
 
 
-def decorator(predicate):
+def decorator(predicate, mark=None):
+    """Create decorator from context generator.
+
+    The decorator can be used as a context, or to decorate
+    functions and classes, in which case the context is entered
+    around every call of the function, or every test of the class.
+
+    :keyword mark: Optional function called as
+        ``mark(predicate, args, kwargs)`` when decorating, returning
+        another decorator to apply, e.g. a pytest mark, or :const:`None`.
+
+    """
     context = contextmanager(predicate)
 
     @wraps(predicate)
@@ -105,6 +127,14 @@ def decorator(predicate):
 
         @wraps(predicate)
         def decorator(cls):
+            decorated = _decorate(cls)
+            if mark is not None:
+                extra = mark(predicate, pargs, pkwargs)
+                if extra is not None:
+                    decorated = extra(decorated)
+            return decorated
+
+        def _decorate(cls):
             if inspect.isclass(cls):
                 if is_unittest_testcase(cls):
                     orig_setup = cls.setUp
@@ -206,6 +236,85 @@ def symbol_by_name(name, aliases={}, imp=None, package=None,
     return default
 
 
+def _imported_spec(name):
+    # spec of module already imported, if it has a real one.
+    spec = getattr(sys.modules.get(name), '__spec__', None)
+    if isinstance(getattr(spec, 'name', None), string_types):
+        return spec
+
+
+def find_module_spec(name):
+    """Find the import spec of module by name, without importing it.
+
+    Unlike :func:`importlib.util.find_spec` this will not import
+    the parent packages of a submodule either.
+
+    Modules in :data:`sys.modules` without a spec of their own
+    (like mock modules) are looked up as if they were not imported.
+
+    Returns :const:`None` if the module cannot be found.
+
+    """
+    spec = _imported_spec(name)
+    if spec is not None:
+        return spec
+    if name in sys.modules and sys.modules[name] is None:
+        return None  # import blocked
+    parent, _, _ = name.rpartition('.')
+    path = None
+    if parent:
+        parent_spec = find_module_spec(parent)
+        if parent_spec is None:
+            return None
+        if _imported_spec(parent) is parent_spec:
+            path = getattr(sys.modules[parent], '__path__', None)
+        else:
+            path = parent_spec.submodule_search_locations
+        if path is None:  # parent is not a package
+            return None
+    for finder in sys.meta_path:
+        find_spec = getattr(finder, 'find_spec', None)
+        if find_spec is not None:
+            spec = find_spec(name, path)
+            if spec is not None:
+                return spec
+
+
+def cache_dir(*parts):
+    """Return path to directory for on-disk caches, creating it
+    if it does not exist.
+
+    The location can be set using the :envvar:`CASE_CACHE_DIR`
+    environment variable, and defaults to :file:`~/.cache/case`.
+
+    """
+    root = os.environ.get('CASE_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or
+        os.path.join(os.path.expanduser('~'), '.cache'), 'case')
+    path = os.path.join(root, *parts)
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    return path
+
+
+def store_json(path, data):
+    """Write ``data`` as JSON to ``path``, replacing the file atomically
+    so that concurrent readers never see a partial file."""
+    tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as fh:
+        json.dump(data, fh)
+    try:
+        replace = os.replace
+    except AttributeError:  # Python 2
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        replace = os.rename
+    replace(tmp, path)
+
+
 class WhateverIO(StringIO):
 
     def __init__(self, v=None, *a, **kw):
@@ -215,5 +324,299 @@ class WhateverIO(StringIO):
         _SIO_write(self, data.decode() if isinstance(data, bytes) else data)
 
 
+class CapturedIO(WhateverIO):
+    """:class:`WhateverIO` that can be searched incrementally.
+
+    Every query remembers how far into the buffer it has already
+    scanned, so calling it again only looks at data written since the
+    last call, instead of copying the whole buffer with
+    :meth:`getvalue`.
+
+    Example::
+
+        with mock.stdouts() as (stdout, stderr):
+            start_worker()
+            assert stdout.wait_for('ready', timeout=10.0)
+            assert stdout.count('connected') == 1
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        WhateverIO.__init__(self, *args, **kwargs)
+        self._lock = threading.RLock()
+        self._offsets = {}
+
+    def write(self, data):
+        with self._lock:
+            return WhateverIO.write(self, data)
+
+    def truncate(self, *args):
+        with self._lock:
+            self._offsets.clear()
+            return WhateverIO.truncate(self, *args)
+
+    def _read_from(self, offset):
+        # read everything written after offset, leaving the
+        # write position untouched.
+        with self._lock:
+            pos = self.tell()
+            try:
+                self.seek(offset)
+                return self.read()
+            finally:
+                self.seek(pos)
+
+    def contains(self, needle):
+        """Return :const:`True` if ``needle`` has been written."""
+        key = ('contains', needle)
+        found, offset = self._offsets.get(key, (False, 0))
+        if not found:
+            data = self._read_from(offset)
+            found = needle in data
+            # keep enough of the tail to find a needle
+            # that spans the boundary of the next write.
+            self._offsets[key] = (found, offset + max(
+                len(data) - len(needle) + 1, 0))
+        return found
+
+    def count(self, needle):
+        """Return the number of non-overlapping occurrences
+        of ``needle`` written so far."""
+        if not needle:
+            raise ValueError('cannot count empty string')
+        key = ('count', needle)
+        count, offset = self._offsets.get(key, (0, 0))
+        data = self._read_from(offset)
+        start, size = 0, len(needle)
+        while 1:
+            index = data.find(needle, start)
+            if index < 0:
+                break
+            count += 1
+            start = index + size
+        self._offsets[key] = (count, offset + max(
+            start, len(data) - size + 1))
+        return count
+
+    def finditer(self, pattern, flags=0):
+        """Iterate over regex matches written since the last call.
+
+        Scanning resumes from the end of the last match, or the start
+        of the last incomplete line, so a match that spans a line
+        already scanned will not be found.  Match positions are relative
+        to the data scanned by this call.
+        """
+        if not hasattr(pattern, 'finditer'):
+            pattern = re.compile(pattern, flags)
+        key = ('finditer', pattern)
+        offset = self._offsets.get(key, 0)
+        data = self._read_from(offset)
+        matches = list(pattern.finditer(data))
+        resume = data.rfind('\n') + 1
+        if matches:
+            resume = max(resume, matches[-1].end())
+        self._offsets[key] = offset + resume
+        return iter(matches)
+
+    def wait_for(self, needle, timeout=1.0, interval=0.01):
+        """Wait for ``needle`` to be written by another thread.
+
+        Returns :const:`False` if ``needle`` was not written
+        within ``timeout`` seconds.
+        """
+        deadline = time.time() + timeout
+        while not self.contains(needle):
+            if time.time() >= deadline:
+                return False
+            time.sleep(interval)
+        return True
+
+
+class LogCapture(logging.Handler):
+    """Logging handler keeping the raw :class:`logging.LogRecord` objects.
+
+    Records are indexed by level and by logger name as they arrive,
+    and are only formatted when asked for, e.g. by :meth:`getvalue`.
+
+    Example::
+
+        with mock.wrap_logger(logger, records=True) as logged:
+            ...
+            assert logged.logged(logging.ERROR, contains='connection lost')
+            assert not logged.find(name='celery.worker')
+
+    """
+
+    def __init__(self, level=logging.NOTSET):
+        logging.Handler.__init__(self, level)
+        self.records = []
+        self.by_level = {}
+        self.by_name = {}
+
+    def emit(self, record):
+        self.records.append(record)
+        self.by_level.setdefault(record.levelno, []).append(record)
+        self.by_name.setdefault(record.name, []).append(record)
+
+    def _candidates(self, level=None, name=None):
+        if level is not None and not isinstance(level, int):
+            level = logging.getLevelName(level)
+        if level is None:
+            if name is None:
+                return self.records
+            return self.by_name.get(name, [])
+        records = self.by_level.get(level, [])
+        if name is not None:
+            by_name = self.by_name.get(name, [])
+            if len(by_name) < len(records):
+                return [r for r in by_name if r.levelno == level]
+            return [r for r in records if r.name == name]
+        return records
+
+    def iterfind(self, level=None, name=None, contains=None):
+        """Iterate over records matching level, logger name and
+        message substring.
+
+        :keyword level: Exact level (number or name) of the record.
+        :keyword name: Exact name of the logger that emitted the record.
+        :keyword contains: Substring of the formatted message.
+
+        """
+        for record in self._candidates(level, name):
+            if contains is None or contains in record.getMessage():
+                yield record
+
+    def find(self, level=None, name=None, contains=None):
+        """Return list of matching records, see :meth:`iterfind`."""
+        return list(self.iterfind(level, name, contains))
+
+    def logged(self, level=None, name=None, contains=None):
+        """Return :const:`True` if any record matches,
+        see :meth:`iterfind`."""
+        for _ in self.iterfind(level, name, contains):
+            return True
+        return False
+
+    def getvalue(self):
+        """Format all records like :class:`logging.StreamHandler`
+        would have."""
+        return ''.join(
+            self.format(record) + '\n' for record in self.records)
+
+    def clear(self):
+        self.records[:] = []
+        self.by_level.clear()
+        self.by_name.clear()
+
+
+class WarningsCapture(object):
+    """Context capturing warnings as they are emitted.
+
+    Warnings are indexed by category as they arrive.  If an
+    ``expected`` category is given only warnings of that category
+    are recorded, the ``expected_regex`` is only tried on those,
+    and once a warning matches recording stops and any further
+    warnings are ignored.  The matching warning is then available
+    as :attr:`warning`.
+
+    Example::
+
+        with WarningsCapture() as captured:
+            ...
+        assert captured.find(DeprecationWarning, 'removal')
+
+        with WarningsCapture(UserWarning, r'^frobulate') as captured:
+            ...
+        assert captured.warning is not None
+
+    """
+
+    #: The first warning matching ``expected`` and ``expected_regex``.
+    warning = None
+    filename = None
+    lineno = None
+
+    #: The first warning of the ``expected`` category, matching or not.
+    first_expected = None
+
+    def __init__(self, expected=None, expected_regex=None):
+        if isinstance(expected_regex, string_types):
+            expected_regex = re.compile(expected_regex)
+        self.expected = expected
+        self.expected_regex = expected_regex
+        self.warnings = []
+        self.by_category = {}
+        self._manager = None
+
+    def __enter__(self):
+        self._manager = warnings.catch_warnings()
+        self._manager.__enter__()
+        warnings.simplefilter('always', self.expected or Warning)
+        # catch_warnings restores showwarning on exit.
+        warnings.showwarning = self._showwarning
+        return self
+
+    def __exit__(self, *exc_info):
+        self._manager.__exit__(*exc_info)
+
+    def _showwarning(self, message, category, filename, lineno,
+                     file=None, line=None):
+        if self.expected is None:
+            return self._record(message, category, filename, lineno, line)
+        if not isinstance(message, self.expected):
+            return
+        self._record(message, category, filename, lineno, line)
+        if self.first_expected is None:
+            self.first_expected = message
+        if (self.expected_regex is None or
+                self.expected_regex.search(str(message))):
+            self.warning, self.filename, self.lineno = (
+                message, filename, lineno)
+            # satisfied: make warnings ignored before they reach us.
+            warnings.simplefilter('ignore')
+
+    def _record(self, message, category, filename, lineno, line):
+        w = warnings.WarningMessage(
+            message, category, filename, lineno, None, line)
+        self.warnings.append(w)
+        self.by_category.setdefault(category, []).append(w)
+
+    @property
+    def satisfied(self):
+        """Set if a warning matching ``expected`` was captured."""
+        return self.warning is not None
+
+    def iterfind(self, category=Warning, regex=None):
+        """Iterate over captured warnings of category
+        (including subclasses) with message matching regex."""
+        if isinstance(regex, string_types):
+            regex = re.compile(regex)
+        categories = [c for c in self.by_category if issubclass(c, category)]
+        if len(categories) == 1:
+            candidates = self.by_category[categories[0]]
+        elif categories:
+            candidates = (w for w in self.warnings
+                          if issubclass(w.category, category))
+        else:
+            candidates = []
+        for w in candidates:
+            if regex is None or regex.search(str(w.message)):
+                yield w
+
+    def find(self, category=Warning, regex=None):
+        """Return list of matching warnings, see :meth:`iterfind`."""
+        return list(self.iterfind(category, regex))
+
+    def __iter__(self):
+        return iter(self.warnings)
+
+    def __len__(self):
+        return len(self.warnings)
+
+    def clear(self):
+        self.warnings[:] = []
+        self.by_category.clear()
+
+
 def noop(*args, **kwargs):
     pass
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""Benchmark the time it takes to report failed equality assertions
+on large (about 1 MB) inputs.
+
+Compares :class:`unittest.TestCase` with :class:`case.Case`,
+which only renders the parts that differ.
+
+Usage::
+
+    $ python extra/bench/failure_diffs.py
+    $ python extra/bench/failure_diffs.py --skip-unittest
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+
+from case import Case  # noqa
+
+
+def _text():
+    lines = ['line {0}: {1}\n'.format(i, 'x' * 40) for i in range(20000)]
+    edited = list(lines)
+    for i in (10, 5000, 15000):
+        edited[i] = edited[i].replace('x', 'y', 1)
+    return ''.join(lines), ''.join(edited)
+
+
+def _inserted_text():
+    first, second = _text()
+    return first, 'inserted\n' + second
+
+
+def _list():
+    first = list(range(100000))  # ~1 MB of repr
+    second = list(first)
+    second[500] = second[90000] = -1
+    return first, second
+
+
+def _shifted_list():
+    first, second = _list()
+    return first, [-1] + second
+
+
+def _dict():
+    first = dict(
+        ('key{0}'.format(i), {'id': i, 'tags': ['a', 'b']})
+        for i in range(15000))
+    second = dict((k, dict(v)) for k, v in first.items())
+    second['key7000'] = {'id': -1, 'tags': ['a', 'b']}
+    return first, second
+
+
+CASES = [
+    ('text, 3 changed lines', _text),
+    ('text, inserted line', _inserted_text),
+    ('list, 2 changed items', _list),
+    ('list, inserted item', _shifted_list),
+    ('dict, 1 changed value', _dict),
+]
+
+
+class _Test(unittest.TestCase):
+
+    def runTest(self):
+        pass
+
+
+class _Case(Case):
+
+    def runTest(self):
+        pass
+
+
+def report(test, first, second):
+    start = time.time()
+    try:
+        test.assertEqual(first, second)
+    except AssertionError as exc:
+        message = str(exc)
+    else:
+        raise RuntimeError('assertion did not fail')
+    return time.time() - start, len(message)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--skip-unittest', action='store_true',
+                        help='Only time case.Case.')
+    parser.add_argument('--max-diff', type=int, default=None,
+                        help='Value of maxDiff (default: unlimited).')
+    args = parser.parse_args(argv)
+
+    tests = [('case', _Case())]
+    if not args.skip_unittest:
+        tests.insert(0, ('unittest', _Test()))
+    for _, test in tests:
+        test.maxDiff = args.max_diff
+    for name, make in CASES:
+        first, second = make()
+        for kind, test in tests:
+            took, size = report(test, first, second)
+            print('{0:<24} {1:<9} {2:10.3f}s {3:10} chars'.format(
+                name, kind, took, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""Benchmark the time it takes to ``import case``.
+
+Every measurement is made in a fresh interpreter, and the median of
+``--repeat`` runs is reported, together with the time it takes to
+start the interpreter and to import :pypi:`nose`, which ``case``
+used to import at startup.
+
+With ``--importtime`` the cumulative import time of each statement
+given is read from ``python -X importtime`` (Python 3.7+) instead,
+along with the modules that took the longest to import.
+If ``--max-ms`` is given the benchmark exits with a non-zero status
+when the median import time of any statement is over it, so it
+can be used to catch import time regressions.
+
+Usage::
+
+    $ python extra/bench/import_case.py --repeat 20
+    $ python extra/bench/import_case.py --importtime --max-ms 20 \\
+        'import case' 'from case import Mock'
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+
+RE_IMPORTTIME = re.compile(
+    r'^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$')
+
+
+def _env():
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [ROOT] + [p for p in [os.environ.get('PYTHONPATH')] if p]))
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def run(code, repeat):
+    env = _env()
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        output = subprocess.check_output(
+            [sys.executable, '-c', code], env=env)
+        timings.append(time.time() - start)
+    return median(timings), output.decode().strip()
+
+
+def importtime(code, repeat):
+    """Return median of total import time of ``code`` in seconds, and
+    mapping of module name to median self import time in seconds."""
+    env = _env()
+    totals, modules = [], {}
+    for _ in range(repeat):
+        proc = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, stderr = proc.communicate()
+        if proc.returncode:
+            raise SystemExit(stderr.decode())
+        total = 0
+        for line in stderr.decode().splitlines():
+            m = RE_IMPORTTIME.match(line)
+            if m:
+                self_us, cumulative_us, indent, name = m.groups()
+                modules.setdefault(name, []).append(int(self_us) / 1e6)
+                if len(indent) == 1:  # top-level import
+                    total += int(cumulative_us)
+        totals.append(total / 1e6)
+    return median(totals), dict(
+        (name, median(values)) for name, values in modules.items())
+
+
+def bench_wall(args):
+    baseline, _ = run('pass', args.repeat)
+    print('interpreter startup: {0:8.2f}ms'.format(baseline * 1000))
+    try:
+        nose, _ = run('import nose', args.repeat)
+    except subprocess.CalledProcessError:
+        print('import nose:         (not installed)')
+    else:
+        print('import nose:         {0:8.2f}ms'.format(
+            (nose - baseline) * 1000))
+    case, loaded = run(
+        'import sys, case; print("nose" in sys.modules)', args.repeat)
+    took = case - baseline
+    print('import case:         {0:8.2f}ms (nose imported: {1})'.format(
+        took * 1000, loaded))
+    return [('import case', took)]
+
+
+def bench_importtime(args):
+    # modules imported by the interpreter itself at startup.
+    _, startup = importtime('pass', 1)
+    results = []
+    for code in args.statements or ['import case']:
+        total, modules = importtime(code, args.repeat)
+        results.append((code, total))
+        print('{0}: {1:.2f}ms'.format(code, total * 1000))
+        slowest = sorted(
+            ((t, name) for name, t in modules.items() if name not in startup),
+            reverse=True)[:args.top]
+        for t, name in slowest:
+            print('    {0:8.2f}ms  {1}'.format(t * 1000, name))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('statements', nargs='*', metavar='STATEMENT',
+                        help='Statements to time with --importtime.')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--importtime', action='store_true',
+                        help='Use python -X importtime.')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest modules to list.')
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='Fail if import time is above this.')
+    args = parser.parse_args(argv)
+
+    bench = bench_importtime if args.importtime else bench_wall
+    failed = [
+        (code, took) for code, took in bench(args)
+        if args.max_ms is not None and took * 1000 > args.max_ms
+    ]
+    for code, took in failed:
+        print('REGRESSION: {0!r} took {1:.2f}ms, limit is {2:.2f}ms'.format(
+            code, took * 1000, args.max_ms), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())